@@ -1,46 +1,114 @@
-import sqlite3
-from pinecone import Pinecone
+"""
+LLM Health Assistant database management.
+
+Without arguments an interactive menu is started. For scripting:
+
+    python CLI_DB_Manager.py query [--limit 20]
+    python CLI_DB_Manager.py export users users.jsonl
+    python CLI_DB_Manager.py export chat_log - --format csv
+    python CLI_DB_Manager.py import users users.jsonl [--on-conflict skip]
+    python CLI_DB_Manager.py remove alice bob
+    python CLI_DB_Manager.py remove --file usernames.txt --workers 8 --checkpoint remove.done
+"""
+import argparse
+import csv
+import json
 import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from backend.vector_store import get_vector_store
+from backend.chat_log import chat_log
 
 # Load environment variables
 load_dotenv()
 
-# Pinecone Configuration
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = "healthassistant"
+# ====== CLI Configuration ======
+DEFAULT_DB_FILE = os.getenv("DATABASE_URL", "sqlite:///./users.db").replace("sqlite:///", "", 1)
+CLI_BATCH_SIZE = int(os.getenv("CLI_BATCH_SIZE", "1000"))  # Rows per fetchmany/executemany round trip
+CLI_DELETE_WORKERS = int(os.getenv("CLI_DELETE_WORKERS", "8"))  # Concurrent vector store namespace deletions
+CHAT_LOG_TABLE = "chat_log"  # Lives in its own database, see backend.chat_log
+
+def connect(db_file):
+    return sqlite3.connect(db_file)
+
+def table_columns(conn, table):
+    return [col[1] for col in conn.execute(f'PRAGMA table_info("{table}")')]
+
+def open_table(table, db_file):
+    """
+    Connection and column names for a table of the users database, or the chat log
+    """
+    conn = connect(chat_log.path if table == CHAT_LOG_TABLE else db_file)
+    columns = table_columns(conn, table)
+    if not columns:
+        conn.close()
+        raise SystemExit(f"Table {table} not found.")
+    return conn, columns
+
+def iter_rows(cursor, batch_size=CLI_BATCH_SIZE):
+    """
+    Stream query results in batches instead of loading the whole table with fetchall()
+    """
+    for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+        yield from rows
+
+class Progress:
+    """
+    Rate-limited progress line on stderr
+    """
+    def __init__(self, label, total=None, interval=0.5):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.count = 0
+        self.start = time.perf_counter()
+        self._last = 0.0
+
+    def update(self, n=1):
+        self.count += n
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._print(now)
 
-pc = Pinecone(api_key=PINECONE_API_KEY, environment="us-east-1-aws")
-pinecone_index = pc.Index(INDEX_NAME)
+    def done(self):
+        self._print(time.perf_counter())
+        print(file=sys.stderr)
 
-def query_sqlite(db_file):
+    def _print(self, now):
+        elapsed = max(now - self.start, 1e-9)
+        total = f"/{self.total}" if self.total is not None else ""
+        print(f"\r{self.label}: {self.count}{total} ({self.count / elapsed:.0f}/s)", end="", file=sys.stderr, flush=True)
+
+# ====== Query ======
+def query_sqlite(db_file, limit=None):
     """
-    Query and print all data from the SQLite database.
+    Print the rows of every table in the SQLite database (at most `limit` per table).
     """
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
-    
+    conn = connect(db_file)
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")]
+
     if not tables:
         print("No tables found in the database.")
     else:
-        for table in tables:
-            table_name = table[0]
+        for table_name in tables:
             print(f"Querying table: {table_name}")
             try:
-                cursor.execute(f"SELECT * FROM {table_name}")
-                rows = cursor.fetchall()
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns_info = cursor.fetchall()
-                columns = [col[1] for col in columns_info]
-                print("Columns:", columns)
-                for row in rows:
+                total = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+                print("Columns:", table_columns(conn, table_name))
+                cursor = conn.execute(f'SELECT * FROM "{table_name}"' + (" LIMIT ?" if limit is not None else ""),
+                                      (limit,) if limit is not None else ())
+                for row in iter_rows(cursor):
                     print(row)
+                if limit is not None and total > limit:
+                    print(f"... {total - limit} more rows (use export for the full table)")
             except Exception as e:
                 print(f"Failed to query table {table_name}. Error: {e}")
             print("-" * 40)
-    cursor.close()
     conn.close()
 
 def query_pinecone():
@@ -48,7 +116,7 @@ def query_pinecone():
     Query and print all namespaces in Pinecone.
     """
     try:
-        stats = pinecone_index.describe_index_stats()
+        stats = get_vector_store().describe_index_stats()
         if "namespaces" in stats and stats["namespaces"]:
             print("Pinecone Namespaces:")
             for namespace in stats["namespaces"].keys():
@@ -58,38 +126,169 @@ def query_pinecone():
     except Exception as e:
         print(f"Failed to query Pinecone. Error: {e}")
 
-def remove_user(username, db_file):
+# ====== Export / Import ======
+def file_format(path, fmt):
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+def export_table(table, output, fmt, db_file):
     """
-    Remove user data from both SQLite and Pinecone.
+    Stream a table to JSONL or CSV ("-" writes to stdout). Returns the number of rows written.
     """
+    conn, columns = open_table(table, db_file)
+    fmt = file_format(output, fmt)
+    out = sys.stdout if output == "-" else open(output, "w", newline="", encoding="utf-8")
+    progress = Progress(f"Exported from {table}")
     try:
-        # Delete from SQLite
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM users WHERE username = ?", (username,))
-        conn.commit()
-        cursor.close()
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(out)
+            writer.writerow(columns)
+        cursor = conn.execute(f'SELECT * FROM "{table}" ORDER BY rowid')
+        for row in iter_rows(cursor):
+            if writer is not None:
+                writer.writerow(["" if value is None else value for value in row])
+            else:
+                out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+            progress.update()
+    finally:
+        if out is not sys.stdout:
+            out.close()
         conn.close()
-        print(f"Removed {username} from SQLite.")
-    except Exception as e:
-        print(f"Failed to remove {username} from SQLite. Error: {e}")
-    
+    progress.done()
+    return progress.count
+
+def read_records(path, fmt):
+    """
+    Yield dicts from a JSONL or CSV file (empty CSV fields become NULL)
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if file_format(path, fmt) == "csv":
+            for record in csv.DictReader(f):
+                yield {key: (value if value != "" else None) for key, value in record.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def import_table(table, path, fmt, db_file, on_conflict="replace"):
+    """
+    Bulk insert records into a table in one transaction. Returns the number of rows written.
+    """
+    conn, columns = open_table(table, db_file)
+    verb = "INSERT OR IGNORE" if on_conflict == "skip" else "INSERT OR REPLACE"
+    progress = Progress(f"Imported into {table}")
+    records = read_records(path, fmt)
+    try:
+        first = next(records, None)
+        if first is None:
+            return 0
+        unknown = set(first) - set(columns)
+        if unknown:
+            raise SystemExit(f"Columns not in {table}: {', '.join(sorted(unknown))}")
+        fields = list(first)
+        sql = f'{verb} INTO "{table}" ({", ".join(fields)}) VALUES ({", ".join("?" for _ in fields)})'
+        written = 0
+        with conn:
+            batch = [first]
+            for record in records:
+                batch.append(record)
+                if len(batch) >= CLI_BATCH_SIZE:
+                    written += conn.executemany(sql, [[r.get(k) for k in fields] for r in batch]).rowcount
+                    progress.update(len(batch))
+                    batch = []
+            if batch:
+                written += conn.executemany(sql, [[r.get(k) for k in fields] for r in batch]).rowcount
+                progress.update(len(batch))
+    finally:
+        conn.close()
+    progress.done()
+    return written
+
+# ====== Remove ======
+def read_usernames(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    return set(read_usernames(path))
+
+def remove_users(usernames, db_file, workers=CLI_DELETE_WORKERS, checkpoint=None):
+    """
+    Remove users from SQLite, the chat log and Pinecone.
+
+    The SQLite rows (users and refresh tokens) and chat messages are deleted in one transaction
+    per database, then the Pinecone namespaces are deleted by a bounded thread pool. Users whose
+    namespace is gone are appended to the checkpoint file, so an interrupted run can be resumed
+    by running the same command again. Returns the usernames whose namespace deletion failed.
+    """
+    done = load_checkpoint(checkpoint)
+    pending = list(dict.fromkeys(u for u in usernames if u not in done))
+    if done:
+        print(f"Skipping {len(usernames) - len(pending)} users already removed according to {checkpoint}.")
+    if not pending:
+        return []
+
+    conn = connect(db_file)
+    try:
+        with conn:
+            params = [(u,) for u in pending]
+            removed = conn.executemany("DELETE FROM users WHERE username = ?", params).rowcount
+            if table_columns(conn, "refresh_tokens"):
+                conn.executemany("DELETE FROM refresh_tokens WHERE username = ?", params)
+        print(f"Removed {removed} users from SQLite.")
+    finally:
+        conn.close()
+
+    deleted = chat_log.delete_users(pending)
+    print(f"Removed {deleted} chat messages.")
+
+    vector_store = get_vector_store()
+    failed = []
+    progress = Progress("Deleted namespaces", total=len(pending))
+    checkpoint_file = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+    checkpoint_lock = threading.Lock()
     try:
-        # Delete namespace from Pinecone
-        pinecone_index.delete(delete_all=True, namespace=username)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(vector_store.delete_namespace, username): username for username in pending}
+            for future in as_completed(futures):
+                username = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.append(username)
+                    print(f"\nFailed to remove {username} from Pinecone. Error: {e}", file=sys.stderr)
+                    continue
+                if checkpoint_file is not None:
+                    with checkpoint_lock:
+                        checkpoint_file.write(username + "\n")
+                        checkpoint_file.flush()
+                progress.update()
+    finally:
+        if checkpoint_file is not None:
+            checkpoint_file.close()
+    progress.done()
+    return failed
+
+def remove_user(username, db_file):
+    """
+    Remove one user's data from SQLite, the chat log and Pinecone.
+    """
+    if not remove_users([username], db_file):
         print(f"Removed namespace {username} from Pinecone.")
-    except Exception as e:
-        print(f"Failed to remove {username} from Pinecone. Error: {e}")
 
-def main():
-    db_file = "users.db"
+# ====== Entry Points ======
+def interactive(db_file):
     while True:
         print("\nLLM Health Assistant Database Management System")
         print("1. query - Query SQLite and Pinecone")
         print("2. remove - Remove user from SQLite and Pinecone")
         print("3. exit - Exit the program")
         choice = input("Enter your choice: ").strip().lower()
-        
+
         if choice == "query":
             print("\nQuerying SQLite Database...")
             query_sqlite(db_file)
@@ -106,5 +305,49 @@ def main():
         else:
             print("Invalid choice. Please enter 'query', 'remove', or 'exit'.")
 
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB_FILE, help="Users database (default from DATABASE_URL)")
+    commands = parser.add_subparsers(dest="command")
+    query = commands.add_parser("query", help="Print SQLite tables and Pinecone namespaces")
+    query.add_argument("--limit", type=int, default=None, help="Rows to print per table")
+    export = commands.add_parser("export", help=f"Stream a table ({CHAT_LOG_TABLE} for the chat log) to JSONL or CSV")
+    export.add_argument("table")
+    export.add_argument("output", help="Output file, '-' for stdout")
+    export.add_argument("--format", choices=("jsonl", "csv"), help="Default from the file extension, jsonl otherwise")
+    load = commands.add_parser("import", help="Bulk insert JSONL or CSV records (e.g. an export) into a table")
+    load.add_argument("table")
+    load.add_argument("input")
+    load.add_argument("--format", choices=("jsonl", "csv"))
+    load.add_argument("--on-conflict", choices=("replace", "skip"), default="replace",
+                      help="For rows whose key already exists. Running servers see changed users after PROFILE_CACHE_TTL")
+    remove = commands.add_parser("remove", help="Remove users from SQLite, the chat log and Pinecone")
+    remove.add_argument("usernames", nargs="*")
+    remove.add_argument("--file", help="File with one username per line")
+    remove.add_argument("--workers", type=int, default=CLI_DELETE_WORKERS, help="Concurrent namespace deletions")
+    remove.add_argument("--checkpoint", help="Records finished users; rerun with the same file to resume")
+    args = parser.parse_args()
+
+    if args.command is None:
+        interactive(args.db)
+    elif args.command == "query":
+        print("\nQuerying SQLite Database...")
+        query_sqlite(args.db, args.limit)
+        print("\nQuerying Pinecone...")
+        query_pinecone()
+    elif args.command == "export":
+        export_table(args.table, args.output, args.format, args.db)
+    elif args.command == "import":
+        written = import_table(args.table, args.input, args.format, args.db, args.on_conflict)
+        print(f"Imported {written} rows into {args.table}.")
+    elif args.command == "remove":
+        usernames = list(args.usernames) + (read_usernames(args.file) if args.file else [])
+        if not usernames:
+            parser.error("remove needs usernames or --file")
+        failed = remove_users(usernames, args.db, args.workers, args.checkpoint)
+        if failed:
+            print(f"{len(failed)} namespace deletions failed, run the command again to retry them.")
+            sys.exit(1)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# ====== Chat Log Configuration ======
+CHAT_LOG_PATH = os.getenv("CHAT_LOG_PATH", "./chat_log.db")
+CHAT_HISTORY_MAX_LIMIT = int(os.getenv("CHAT_HISTORY_MAX_LIMIT", "100"))  # Largest page served by /api/chat/{username}
+
+USER = "user"
+MODEL = "model"
+
+def new_turn_id() -> str:
+    """
+    Unique, roughly time-ordered id for one chat message (also used in its vector id)
+    """
+    return f"{time.time_ns():x}-{uuid.uuid4().hex[:8]}"
+
+class ChatLog:
+    """
+    Append-only chat log in SQLite. Rows are numbered by an autoincrement sequence, so the
+    (username, seq) index answers "latest N messages" and keyset pagination with a range scan.
+    Vector search stays in the vector store and is only used for semantic recall.
+    """
+    def __init__(self, path: str = CHAT_LOG_PATH):
+        self.path = path
+        self.counters = {"appended": 0, "pages_served": 0}
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_log ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, turn_id TEXT NOT NULL UNIQUE, username TEXT NOT NULL, "
+                "role TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chat_log_user_seq ON chat_log (username, seq)")
+            self._conn.commit()
+        return self._conn
+
+    def append(self, username: str, messages):
+        """
+        Append (role, content) messages for a user in one transaction. Returns their turn ids
+        """
+        now = time.time()
+        rows = [(new_turn_id(), username, role, content, now) for role, content in messages]
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("INSERT INTO chat_log (turn_id, username, role, content, created_at) VALUES (?, ?, ?, ?, ?)", rows)
+            conn.commit()
+        self.counters["appended"] += len(rows)
+        return [row[0] for row in rows]
+
+    def recent(self, username: str, limit: int, before: int = None):
+        """
+        Latest `limit` messages older than the `before` cursor, oldest first.
+        Returns (turns, next_before); next_before is None on the last page.
+        """
+        limit = max(1, min(limit, CHAT_HISTORY_MAX_LIMIT))
+        query = "SELECT seq, turn_id, role, content, created_at FROM chat_log WHERE username = ?"
+        params = [username]
+        if before is not None:
+            query += " AND seq < ?"
+            params.append(before)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit + 1)  # One extra row tells whether an older page exists
+        with self._lock:
+            rows = self._connect().execute(query, params).fetchall()
+        self.counters["pages_served"] += 1
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        turns = [
+            {"seq": seq, "turn_id": turn_id, "role": role, "content": content, "created_at": created_at}
+            for seq, turn_id, role, content, created_at in reversed(rows)
+        ]
+        return turns, (turns[0]["seq"] if has_more else None)
+
+    def scan(self, after: int = 0, batch_size: int = 1000):
+        """
+        Stream (seq, turn_id, username, role, content) rows with seq > `after` in log order,
+        on a separate connection so the application's connection is not held
+        """
+        with self._lock:
+            self._connect()  # Creates the table when the log is new
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(
+                "SELECT seq, turn_id, username, role, content FROM chat_log WHERE seq > ? ORDER BY seq", (after,)
+            )
+            for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+                yield from rows
+        finally:
+            conn.close()
+
+    def delete_users(self, usernames) -> int:
+        """
+        Remove every message of the given users in one transaction, returns the number of rows deleted
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                deleted = conn.executemany("DELETE FROM chat_log WHERE username = ?", [(u,) for u in usernames]).rowcount
+        return deleted
+
+    def stats(self):
+        return dict(self.counters)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+chat_log = ChatLog()
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from backend.embeddings import embedding_service
+from backend.vector_store import get_vector_store
+from backend.metrics import stage, detach_request_timings
+
+# ====== Write-behind Configuration ======
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "1000"))
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "64"))
+CHAT_WRITE_FLUSH_INTERVAL = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", "1.0"))  # Seconds
+CHAT_WRITE_ENQUEUE_TIMEOUT = float(os.getenv("CHAT_WRITE_ENQUEUE_TIMEOUT", "2.0"))  # Backpressure wait before dropping
+
+_STOP = object()
+
+class ChatWriter:
+    """
+    Write-behind pipeline for chat persistence.
+
+    Requests enqueue (namespace, id, text, metadata) records and return immediately. A background
+    task embeds pending records in one batch and upserts them per namespace once the batch is full
+    or the flush interval has passed. When the queue is full, producers wait up to the enqueue
+    timeout before the record is dropped.
+    """
+    def __init__(self, queue_size: int = CHAT_WRITE_QUEUE_SIZE, batch_size: int = CHAT_WRITE_BATCH_SIZE,
+                 flush_interval: float = CHAT_WRITE_FLUSH_INTERVAL, enqueue_timeout: float = CHAT_WRITE_ENQUEUE_TIMEOUT):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.counters = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._worker = asyncio.ensure_future(self._run())
+
+    async def enqueue(self, namespace: str, records):
+        """
+        Queue (vector_id, text, metadata) records for a namespace. Returns False if any were dropped
+        """
+        self._ensure_worker()
+        accepted = True
+        with stage("chat_enqueue"):
+            for vector_id, text, metadata in records:
+                try:
+                    await asyncio.wait_for(self._queue.put((namespace, vector_id, text, metadata)), timeout=self.enqueue_timeout)
+                    self.counters["enqueued"] += 1
+                except asyncio.TimeoutError:
+                    self.counters["dropped"] += 1
+                    accepted = False
+                    logging.error(f"Chat write queue full, dropped {vector_id} for namespace {namespace}")
+        return accepted
+
+    async def _next_batch(self):
+        first = await self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            getter = asyncio.ensure_future(self._queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=remaining)
+            if not done:
+                getter.cancel()
+                break
+            item = getter.result()
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _flush(self, batch):
+        try:
+            vectors = await embedding_service.aencode([text for _, _, text, _ in batch])
+        except Exception as e:
+            self.counters["failed"] += len(batch)
+            logging.error(f"Error embedding {len(batch)} chat records: {e}")
+            return
+
+        by_namespace = defaultdict(list)
+        for (namespace, vector_id, text, metadata), vector in zip(batch, vectors):
+            by_namespace[namespace].append((vector_id, vector.tolist(), {"text": text, **(metadata or {})}))
+
+        vector_store = get_vector_store()
+        for namespace, records in by_namespace.items():
+            try:
+                with stage("vector_write"):
+                    await asyncio.to_thread(vector_store.upsert, records, namespace)
+                self.counters["written"] += len(records)
+            except Exception as e:
+                self.counters["failed"] += len(records)
+                logging.error(f"Error storing {len(records)} chat records in namespace {namespace}: {e}")
+        self.counters["batches"] += 1
+
+    async def _run(self):
+        # The worker outlives the request that started it, keep its stages out of that request's timings
+        detach_request_timings()
+        stop = False
+        while not stop:
+            batch, stop = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+
+    async def close(self):
+        """
+        Flush everything already queued and stop the worker (called on application shutdown)
+        """
+        if self._worker is None or self._worker.done():
+            return
+        await self._queue.put(_STOP)
+        await self._worker
+
+    def stats(self):
+        return {**self.counters, "pending": self._queue.qsize() if self._queue is not None else 0}
+
+chat_writer = ChatWriter()
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the on-disk store is unavailable
+    fcntl = None
+
+# ====== Embedding Cache Configuration ======
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # 0 disables the cache
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")  # "float32" or "float16"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")  # Directory of the memory-mapped store, empty disables it
+
+DIGEST_SIZE = 16
+_GROW_ROWS = 4096
+
+def cache_key(model_name: str, text: str) -> bytes:
+    """
+    Content address of a text under a given model
+    """
+    return hashlib.blake2b(f"{model_name}\0{text}".encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+class MmapVectorStore:
+    """
+    Append-only on-disk vector store: a memory-mapped matrix plus a file of row keys.
+
+    Every uvicorn worker opens the same directory. Writers hold an exclusive flock on the lock file
+    while they pick up key records appended by other processes, write the vector row and append
+    its key, so rows are never handed out twice. The vector row is written before its key, so a
+    crash can only lose the last entry (a torn key record is cut by the next writer).
+    """
+    def __init__(self, directory: str, dtype: str = EMBEDDING_CACHE_DTYPE):
+        if fcntl is None:
+            raise RuntimeError("EMBEDDING_CACHE_PATH needs fcntl file locks (POSIX)")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self._index = {}
+        self._rows = 0  # Complete key records read from keys.bin
+        self._matrix = None
+        self._lock = threading.Lock()
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._keys_path = os.path.join(directory, "keys.bin")
+        self._vectors_path = os.path.join(directory, "vectors.bin")
+        self._lock_file = open(os.path.join(directory, "lock"), "a")
+        with self._lock, self._file_lock():
+            self._refresh()
+
+    @contextmanager
+    def _file_lock(self):
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _keys_size(self) -> int:
+        return os.path.getsize(self._keys_path) if os.path.exists(self._keys_path) else 0
+
+    def _refresh(self):
+        """
+        Index key records appended since the last refresh, by this or another process (file lock held)
+        """
+        if self.dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            if np.dtype(meta["dtype"]) != self.dtype:
+                raise ValueError(f"Embedding cache at {self.directory} stores {meta['dtype']}, not {self.dtype}")
+            self.dim = meta["dim"]
+        size = self._keys_size()
+        if size % DIGEST_SIZE:
+            # Only a crashed writer leaves a partial record, and writers hold the lock
+            size -= size % DIGEST_SIZE
+            with open(self._keys_path, "r+b") as f:
+                f.truncate(size)
+        if size > self._rows * DIGEST_SIZE:
+            with open(self._keys_path, "rb") as f:
+                f.seek(self._rows * DIGEST_SIZE)
+                keys = f.read(size - self._rows * DIGEST_SIZE)
+            for offset in range(0, len(keys), DIGEST_SIZE):
+                self._index.setdefault(keys[offset:offset + DIGEST_SIZE], self._rows + offset // DIGEST_SIZE)
+            self._rows = size // DIGEST_SIZE
+        if self._matrix is None or self._rows > self._matrix.shape[0]:
+            self._map(max(self._rows, 1))
+
+    def _map(self, min_rows: int):
+        rows = -(-min_rows // _GROW_ROWS) * _GROW_ROWS
+        size = rows * self.dim * self.dtype.itemsize
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        if self._matrix is not None:
+            self._matrix.flush()
+        self._matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode="r+", shape=(rows, self.dim))
+
+    def get(self, key: bytes):
+        row = self._index.get(key)
+        if row is None:
+            if self._keys_size() < (self._rows + 1) * DIGEST_SIZE:
+                return None
+            # Another worker has added entries since the last refresh
+            with self._lock, self._file_lock():
+                self._refresh()
+                row = self._index.get(key)
+            if row is None:
+                return None
+        return np.array(self._matrix[row])
+
+    def put(self, key: bytes, vector: np.ndarray):
+        with self._lock, self._file_lock():
+            self._refresh()
+            if key in self._index:
+                return
+            if self.dim is None:
+                self.dim = int(vector.shape[0])
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+                open(self._keys_path, "ab").close()
+            row = self._rows
+            if self._matrix is None or row >= self._matrix.shape[0]:
+                self._map(row + 1)
+            self._matrix[row] = vector
+            with open(self._keys_path, "ab") as f:
+                f.write(key)
+            self._index[key] = row
+            self._rows += 1
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: byte-budgeted in-memory LRU over an optional mmap store
+    """
+    def __init__(self, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES, dtype: str = EMBEDDING_CACHE_DTYPE,
+                 path: str = EMBEDDING_CACHE_PATH):
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.disk = MmapVectorStore(path, dtype) if path else None
+        self.bytes = 0
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str, text: str):
+        """
+        Return the cached float32 vector for (model, text), or None
+        """
+        key = cache_key(model_name, text)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.counters["hits"] += 1
+                return vector.astype(np.float32)
+        vector = self.disk.get(key) if self.disk is not None else None
+        if vector is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["disk_hits"] += 1
+        self._remember(key, vector)
+        return vector.astype(np.float32)
+
+    def put(self, model_name: str, text: str, vector: np.ndarray):
+        key = cache_key(model_name, text)
+        compact = np.ascontiguousarray(vector, dtype=self.dtype)
+        self._remember(key, compact)
+        if self.disk is not None:
+            self.disk.put(key, compact)
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        size = vector.nbytes + DIGEST_SIZE
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._lru.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.nbytes + DIGEST_SIZE
+            self._lru[key] = vector
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._lru.popitem(last=False)
+                self.bytes -= evicted.nbytes + DIGEST_SIZE
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        return {
+            **self.counters,
+            "entries": len(self._lru),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
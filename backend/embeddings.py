@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from backend.embedding_cache import EmbeddingCache, EMBEDDING_CACHE_MAX_BYTES
+from backend.metrics import stage, record_stage
+
+# ====== Embedding Configuration ======
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIMENSION = 384
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # "torch" (sentence-transformers), "onnx" or "onnx-int8"
+EMBEDDING_ONNX_PATH = os.getenv("EMBEDDING_ONNX_PATH", "./models/all-MiniLM-L6-v2-onnx")  # Written by backend.onnx_embedder
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # Intra-op threads per worker process, 0 keeps the runtime default
+
+TORCH = "torch"
+ONNX = "onnx"
+ONNX_INT8 = "onnx-int8"
+EMBEDDING_BACKENDS = (TORCH, ONNX, ONNX_INT8)
+
+_STOP = object()
+
+def load_embedding_model(model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND,
+                         threads: int = EMBEDDING_THREADS):
+    """
+    Load the embedder for a backend. Every backend has SentenceTransformer's
+    `encode(texts, batch_size, convert_to_numpy)` and returns L2-normalised float32 vectors.
+    """
+    if backend == TORCH:
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads > 0:
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name)
+    if backend in (ONNX, ONNX_INT8):
+        from backend.onnx_embedder import OnnxEmbedder
+        return OnnxEmbedder(EMBEDDING_ONNX_PATH, quantized=backend == ONNX_INT8, threads=threads)
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {', '.join(EMBEDDING_BACKENDS)}")
+
+class EmbeddingService:
+    """
+    Process-wide embedding model with dynamic micro-batching.
+
+    Callers submit single texts and get futures back. A worker thread collects pending texts
+    until `max_batch_size` is reached or `max_wait_ms` has passed since the first one arrived,
+    then runs them through the model as one `encode` call. Texts found in the embedding cache
+    resolve immediately and never reach the model.
+    """
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+                 max_wait_ms: float = EMBEDDING_MAX_WAIT_MS, cache: EmbeddingCache = None, backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        # Quantised vectors differ slightly from fp32 ones, so each backend gets its own cache entries
+        self.cache_key = model_name if backend == TORCH else f"{model_name}:{backend}"
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """
+        The underlying model of the configured backend, loaded on first use
+        """
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = load_embedding_model(self.model_name, self.backend)
+        return self._model
+
+    def warm_up(self):
+        """
+        Load the model and run one inference directly (bypassing the cache) so first requests are fast
+        """
+        self.model.encode(["warm-up"], convert_to_numpy=True)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """
+        Queue one text for embedding; the future resolves to a float32 vector
+        """
+        future = Future()
+        if self.cache is not None:
+            vector = self.cache.get(self.cache_key, text)
+            if vector is not None:
+                future.set_result(vector)
+                return future
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, texts) -> np.ndarray:
+        """
+        Blocking encode of a list of texts through the batcher (for sync code and worker threads)
+        """
+        with stage("embedding"):
+            futures = [self.submit(text) for text in texts]
+            return np.stack([f.result() for f in futures])
+
+    async def aencode(self, texts) -> np.ndarray:
+        """
+        Encode a list of texts through the batcher without blocking the event loop
+        """
+        with stage("embedding"):
+            futures = [asyncio.wrap_future(self.submit(text)) for text in texts]
+            return np.stack(await asyncio.gather(*futures))
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+    def shutdown(self):
+        """
+        Stop the worker thread after the already queued texts have been encoded
+        """
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(_STOP)
+            self._worker.join()
+        if self.cache is not None:
+            self.cache.close()
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None, True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._collect_batch()
+            # Drop texts whose callers already gave up (e.g. a cancelled request)
+            batch = [(text, future) for text, future in batch or [] if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = [text for text, _ in batch]
+            start = time.perf_counter()
+            try:
+                vectors = self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True).astype(np.float32, copy=False)
+            except Exception as e:
+                logging.error(f"Embedding batch of {len(texts)} failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            record_stage("embedding_batch", time.perf_counter() - start)
+            self.batches += 1
+            self.items += len(texts)
+            for (text, future), vector in zip(batch, vectors):
+                if self.cache is not None:
+                    self.cache.put(self.cache_key, text, vector)
+                future.set_result(vector)
+
+embedding_service = EmbeddingService(cache=EmbeddingCache() if EMBEDDING_CACHE_MAX_BYTES > 0 else None)
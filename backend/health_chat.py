@@ -1,14 +1,30 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.responses import StreamingResponse
 import os
+import json
+import asyncio
 import logging
+import sqlite3
 from pydantic import BaseModel
-import requests
+import httpx
 from jose import jwt, JWTError
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
 import os
 from dotenv import load_dotenv
+from backend.http_clients import get_client, ZHIPU
+from backend.pubmed_service import search_pubmed, format_article
+from backend.embeddings import embedding_service
+from backend.vector_store import get_vector_store
+from backend.chat_writer import chat_writer
+from backend.chat_log import chat_log, USER, MODEL
+from backend.vector_ids import chat_vector_id
+from backend.intent_router import intent_router
+from backend.semantic_cache import semantic_cache
+from backend.prompt_builder import build_context, collect_snippets
+from backend.metrics import stage, record_stage
+from backend.upstream import (get_upstream, deadline, time_budget, is_retryable_status, RetryableStatus,
+                              UpstreamError, CircuitOpenError, DeadlineExceeded)
+import time
 
 # Load environment variables
 load_dotenv() 
@@ -20,19 +36,14 @@ logging.basicConfig(level=logging.INFO)
 router = APIRouter(prefix="/api/health_chat", tags=["Health Chat"])
 
 # ====== Zhipu API Configuration ======
-ZHIPU_API_URL = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+ZHIPU_API_URL = os.getenv("ZHIPU_API_URL", "https://open.bigmodel.cn/api/paas/v4/chat/completions")
 ZHIPU_API_KEY = os.getenv("ZHIPU_API_KEY")
 
-# ====== Pinecone Configuration ======
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = "healthassistant"
-embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
-pc = Pinecone(api_key=PINECONE_API_KEY, environment="us-east-1-aws")
-pinecone_index = pc.Index(INDEX_NAME)
-
-# ====== PubMed API Configuration ======
-PUBMED_API_URL = "http://localhost:8000/api/query_pubmed"
+# ====== Per-stage Timeouts (seconds) ======
+PINECONE_QUERY_TIMEOUT = float(os.getenv("PINECONE_QUERY_TIMEOUT", "3"))
+PUBMED_QUERY_TIMEOUT = float(os.getenv("PUBMED_QUERY_TIMEOUT", "10"))
+ZHIPU_TIMEOUT = float(os.getenv("ZHIPU_TIMEOUT", "60"))
+HEALTH_CHAT_DEADLINE = float(os.getenv("HEALTH_CHAT_DEADLINE", "75"))  # Retrieval plus the LLM call (until the first byte when streaming)
 
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -53,100 +64,99 @@ def verify_token(token: str):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-# Keywords Matching Library (Expert System)
-PINECONE_KEYWORDS = [
-    "my personal info", "personal history", "previous conversation", "past chat", "my data",
-     "my age", "my profile", "my records", "my history"
-]
-PUBMED_KEYWORDS = [
-    "paper", "study", "research", "pubmed", "clinical trial", "medical journal", "scientific article",
-    "medical research", "case study", "clinical evidence"
-]
+# Keywords Matching Library (Expert System), rules live in backend/intents.json
+PINECONE_INTENT = "pinecone"
+PUBMED_INTENT = "pubmed"
 
 # Pydantic Request Model
 class ChatRequest(BaseModel):
     prompt: str
+    stream: bool = False  # Relay tokens as Server-Sent Events while they arrive
 
 def should_query_pinecone(user_input: str) -> bool:
     """
     Returns True if the user's question contains Pinecone related keywords
     """
-    return any(keyword in user_input.lower() for keyword in PINECONE_KEYWORDS)
+    return PINECONE_INTENT in intent_router.match(user_input)
 
 def should_query_pubmed(user_input: str) -> bool:
     """
     Returns True if the user's question contains PubMed-related keywords
     """
-    return any(keyword in user_input.lower() for keyword in PUBMED_KEYWORDS)
+    return PUBMED_INTENT in intent_router.match(user_input)
+
+async def _query_pinecone(user_query: str, username: str, top_k: int):
+    query_vector = (await embedding_service.aencode([user_query]))[0].tolist()
+    # Vector store calls are blocking, keep them off the event loop
+    with stage("vector_query"):
+        results = await asyncio.to_thread(get_vector_store().query, vector=query_vector, top_k=top_k, include_metadata=True, namespace=username)
+    return [{"id": r["id"], "text": r["metadata"]["text"], "score": r["score"]} for r in results.get("matches", []) if r["metadata"].get("text")]
 
-def query_pinecone(user_query: str, username: str, top_k: int = 3):
+async def query_pinecone(user_query: str, username: str, top_k: int = 3):
     """
-    Query Pinecone to get historical chat records
+    Query Pinecone for historical chat records and the stored profile, as {"id", "text", "score"} matches
     """
     try:
-        query_vector = embedding_model.encode([user_query])[0].tolist()
-        results = pinecone_index.query(vector=query_vector, top_k=top_k, include_metadata=True, namespace=username)
-        return [r["metadata"]["text"] for r in results.get("matches", [])] if results.get("matches") else []
+        return await asyncio.wait_for(_query_pinecone(user_query, username, top_k), timeout=time_budget(PINECONE_QUERY_TIMEOUT))
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        logging.error(f"Pinecone query timed out after {PINECONE_QUERY_TIMEOUT}s")
+        return []
     except Exception as e:
         logging.error(f"Error querying Pinecone: {e}")
         return []
 
-def query_pubmed(user_query: str):
+async def query_pubmed(user_query: str):
     """
-    Query PubMed articles with `query_pubmed.py`
+    Query PubMed article records in-process through the shared PubMed service
     """
     try:
-        response = requests.post(PUBMED_API_URL, json={"query": user_query})
-        if response.status_code == 200:
-            return response.json().get("results", [])
-        else:
-            logging.error(f"PubMed API Error: {response.status_code}, {response.text}")
-            return ["Error fetching PubMed data"]
+        return await asyncio.wait_for(search_pubmed(user_query), timeout=time_budget(PUBMED_QUERY_TIMEOUT))
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        logging.error(f"PubMed query timed out after {PUBMED_QUERY_TIMEOUT}s")
+        return []
     except Exception as e:
-        logging.error(f"Error connecting to PubMed API: {e}")
-        return ["Error connecting to PubMed API"]
+        # Includes an open NCBI circuit breaker: answer without PubMed context instead of failing
+        logging.error(f"Error querying PubMed, answering without it: {e}")
+        return []
 
-import re
+async def _no_results():
+    return []
 
-def store_chat_in_pinecone(username: str, user_input: str, model_response: str):
+async def store_chat_turn(username: str, user_input: str, model_response: str):
     """
-    Store user chat history in Pinecone
+    Append the chat turn to the chat log, then queue both messages for write-behind persistence in Pinecone
     """
     try:
-        sanitized_user_input = re.sub(r'[^\x00-\x7F]+', '', user_input)  # Remove non-ASCII characters
-        user_vector_id = f"user-{username}-{sanitized_user_input[:10]}"
-        model_vector_id = f"model-{username}-{sanitized_user_input[:10]}"
-
-        vector = embedding_model.encode([user_input])[0].tolist()
-        pinecone_index.upsert([(user_vector_id, vector, {"text": user_input})], namespace=username)
-
-        vector_response = embedding_model.encode([model_response])[0].tolist()
-        pinecone_index.upsert([(model_vector_id, vector_response, {"text": model_response})], namespace=username)
-    except Exception as e:
-        logging.error(f"Error storing chat in Pinecone: {e}")
+        with stage("chat_log_append"):
+            user_turn_id, model_turn_id = await asyncio.to_thread(
+                chat_log.append, username, [(USER, user_input), (MODEL, model_response)]
+            )
+    except sqlite3.Error as e:
+        logging.error(f"Error appending chat turn for {username} to the chat log: {e}")
+        return
+    accepted = await chat_writer.enqueue(username, [
+        (chat_vector_id(username, USER, user_turn_id), user_input, {"turn_id": user_turn_id, "role": USER}),
+        (chat_vector_id(username, MODEL, model_turn_id), model_response, {"turn_id": model_turn_id, "role": MODEL}),
+    ])
+    if not accepted:
+        logging.warning(
+            f"Chat turns {user_turn_id}, {model_turn_id} for {username} are in the chat log but their vectors were dropped"
+        )
 
-@router.post("/")
-def chat_with_model(request: ChatRequest, token: str = Depends(oauth2_scheme)):
+async def build_final_prompt(user_input: str, username: str, intents) -> str:
     """
-    Processing users' health consultation requests
+    Retrieve context from Pinecone and PubMed for the routed intents and build the LLM prompt,
+    keeping the retrieved context within PROMPT_CONTEXT_TOKEN_BUDGET
     """
-    username = verify_token(token)
-    logging.info(f"Received request from {username}: prompt={request.prompt}")
+    # Query Pinecone history and PubMed concurrently, so retrieval costs the slower of the two
+    with stage("retrieval"):
+        chat_history, pubmed_results = await asyncio.gather(
+            query_pinecone(user_input, username) if PINECONE_INTENT in intents else _no_results(),
+            query_pubmed(user_input) if PUBMED_INTENT in intents else _no_results(),
+        )
 
-    user_input = request.prompt
-    retrieved_context = ""
-
-    # Query Pinecone historical chat records
-    if should_query_pinecone(user_input):
-        chat_history = query_pinecone(user_input, username)
-        if chat_history:
-            retrieved_context += "### Previous Conversations:\n" + "\n".join(chat_history) + "\n"
-
-    # Search PubMed for related studies
-    if should_query_pubmed(user_input):
-        pubmed_results = query_pubmed(user_input)
-        if pubmed_results:
-            retrieved_context += "### Relevant Research from PubMed:\n" + "\n".join(pubmed_results) + "\n"
+    with stage("prompt_build"):
+        retrieved_context = build_context(collect_snippets(user_input, chat_history, pubmed_results, format_article))
 
     # Build the final prompt
     final_prompt = f"""
@@ -160,7 +170,12 @@ def chat_with_model(request: ChatRequest, token: str = Depends(oauth2_scheme)):
     """
     # print("Final prompt")
     # print(final_prompt)
+    return final_prompt
 
+def build_zhipu_request(final_prompt: str, stream: bool = False):
+    """
+    Headers and payload of the GLM-4-Plus chat-completions call
+    """
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {ZHIPU_API_KEY}"
@@ -171,13 +186,185 @@ def chat_with_model(request: ChatRequest, token: str = Depends(oauth2_scheme)):
         "temperature": 0.5,
         "max_tokens": 1000
     }
+    if stream:
+        payload["stream"] = True
+    return headers, payload
+
+def sse_event(data: dict, event: str = None) -> str:
+    """
+    Encode one Server-Sent Event
+    """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def zhipu_http_error(e: UpstreamError) -> HTTPException:
+    """
+    Map a failed Zhipu call to the status returned to the client
+    """
+    logging.error(f"Zhipu API call failed: {e}")
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail="The language model is temporarily unavailable, please retry shortly.")
+    if isinstance(e, DeadlineExceeded) or isinstance(e.__cause__, (asyncio.TimeoutError, httpx.TimeoutException)):
+        return HTTPException(status_code=504, detail="Zhipu API timed out")
+    return HTTPException(status_code=502, detail=f"Error calling Zhipu API: {e}")
+
+async def open_zhipu_stream(final_prompt: str) -> httpx.Response:
+    """
+    Start a streaming completion; raises HTTPException before any byte is sent to the client
+    """
+    headers, payload = build_zhipu_request(final_prompt, stream=True)
+    client = get_client(ZHIPU)
+
+    async def op(timeout):
+        upstream_request = client.build_request("POST", ZHIPU_API_URL, headers=headers, json=payload, timeout=timeout)
+        response = await client.send(upstream_request, stream=True)
+        if is_retryable_status(response.status_code):
+            body = (await response.aread()).decode("utf-8", errors="replace")
+            await response.aclose()
+            raise RetryableStatus(response.status_code, body[:200])
+        return response
+
+    try:
+        with stage("llm_first_byte"):
+            response = await get_upstream(ZHIPU).call(op, ZHIPU_TIMEOUT)
+    except UpstreamError as e:
+        raise zhipu_http_error(e)
+
+    if response.status_code != 200:
+        body = (await response.aread()).decode("utf-8", errors="replace")
+        await response.aclose()
+        logging.error(f"Zhipu API Error: {response.status_code}, {body}")
+        raise HTTPException(status_code=500, detail=f"Zhipu API Error: {response.status_code}, {body}")
+    return response
 
-    response = requests.post(ZHIPU_API_URL, headers=headers, json=payload)
+async def post_zhipu(final_prompt: str) -> httpx.Response:
+    """
+    Non-streaming completion through the Zhipu call policy
+    """
+    headers, payload = build_zhipu_request(final_prompt)
+
+    async def op(timeout):
+        response = await get_client(ZHIPU).post(ZHIPU_API_URL, headers=headers, json=payload, timeout=timeout)
+        if is_retryable_status(response.status_code):
+            raise RetryableStatus(response.status_code, response.text[:200])
+        return response
+
+    try:
+        with stage("llm"):
+            return await get_upstream(ZHIPU).call(op, ZHIPU_TIMEOUT)
+    except UpstreamError as e:
+        raise zhipu_http_error(e)
+
+async def relay_zhipu_stream(response: httpx.Response, username: str, user_input: str, cache_vector=None):
+    """
+    Relay upstream deltas as SSE, then persist (and cache) the assembled answer once the stream ends
+    """
+    parts = []
+    start = time.perf_counter()
+    try:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                logging.warning(f"Skipping malformed Zhipu stream chunk: {data[:200]}")
+                continue
+            delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content")
+            if delta:
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+    except httpx.HTTPError as e:
+        logging.error(f"Zhipu stream interrupted: {e}")
+        yield sse_event({"detail": f"Zhipu stream interrupted: {e}"}, event="error")
+        return
+    finally:
+        await response.aclose()
+        record_stage("llm_stream", time.perf_counter() - start)
+
+    model_response = "".join(parts)
+    yield sse_event({"response": model_response}, event="done")
+    if cache_vector is not None:
+        semantic_cache.store(cache_vector, user_input, model_response)
+    await store_chat_turn(username, user_input, model_response)
+
+async def replay_cached_answer(answer: str):
+    """
+    Serve a semantic-cache hit in the same SSE shape as a live stream
+    """
+    yield sse_event({"delta": answer})
+    yield sse_event({"response": answer}, event="done")
+
+async def lookup_semantic_cache(user_input: str, intents):
+    """
+    Returns (cached answer or None, prompt vector or None). Prompts routed to the user's
+    personal history are never cached, their answers are user-specific.
+    """
+    if not semantic_cache.enabled or PINECONE_INTENT in intents:
+        return None, None
+    try:
+        vector = (await embedding_service.aencode([user_input]))[0]
+    except Exception as e:
+        logging.error(f"Semantic cache embedding failed: {e}")
+        return None, None
+    with stage("semantic_cache"):
+        hit = semantic_cache.lookup(vector)
+    if hit is None:
+        return None, vector
+    answer, similarity = hit
+    logging.info(f"Semantic cache hit (similarity={similarity:.3f})")
+    return answer, vector
+
+@router.post("/")
+async def chat_with_model(request: ChatRequest, token: str = Depends(oauth2_scheme)):
+    """
+    Processing users' health consultation requests
+    """
+    username = verify_token(token)
+    logging.info(f"Received request from {username}: prompt={request.prompt}")
+
+    user_input = request.prompt
+    intents = await intent_router.route(user_input)
+    sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    cached_answer, cache_vector = await lookup_semantic_cache(user_input, intents)
+    if cached_answer is not None:
+        await store_chat_turn(username, user_input, cached_answer)
+        if request.stream:
+            return StreamingResponse(replay_cached_answer(cached_answer), media_type="text/event-stream", headers=sse_headers)
+        return {"response": cached_answer}
+
+    # One deadline for retrieval and the LLM call; each stage only gets what is left of it
+    with deadline(HEALTH_CHAT_DEADLINE):
+        final_prompt = await build_final_prompt(user_input, username, intents)
+
+        if request.stream:
+            response = await open_zhipu_stream(final_prompt)
+            return StreamingResponse(
+                relay_zhipu_stream(response, username, user_input, cache_vector),
+                media_type="text/event-stream",
+                headers=sse_headers,
+            )
+
+        response = await post_zhipu(final_prompt)
 
     if response.status_code == 200:
         model_response = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
-        store_chat_in_pinecone(username, user_input, model_response)
+        if cache_vector is not None:
+            semantic_cache.store(cache_vector, user_input, model_response)
+        # Write-behind: the user does not wait on embedding or vector writes
+        await store_chat_turn(username, user_input, model_response)
         return {"response": model_response}
     else:
         logging.error(f"Zhipu API Error: {response.status_code}, {response.text}")
         raise HTTPException(status_code=500, detail=f"Zhipu API Error: {response.status_code}, {response.text}")
+
+@router.get("/cache_stats")
+def cache_stats():
+    """
+    Hit-rate metrics of the semantic answer cache
+    """
+    return semantic_cache.stats()
@@ -0,0 +1,30 @@
+import httpx
+
+# ====== Connection Pool Configuration ======
+# One long-lived AsyncClient per upstream keeps TCP/TLS connections alive
+# between requests instead of opening a new connection for every call.
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+ZHIPU = "zhipu"
+NCBI = "ncbi"
+
+_clients = {}
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """
+    Return the pooled async client for the given upstream, creating it on first use
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=POOL_LIMITS, timeout=DEFAULT_TIMEOUT)
+        _clients[name] = client
+    return client
+
+async def close_clients():
+    """
+    Close every pooled client (called on application shutdown)
+    """
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
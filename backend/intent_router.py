@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+from backend.embeddings import embedding_service
+
+# ====== Intent Router Configuration ======
+INTENTS_CONFIG_PATH = os.getenv("INTENTS_CONFIG_PATH", os.path.join(os.path.dirname(__file__), "intents.json"))
+INTENTS_RELOAD_INTERVAL = float(os.getenv("INTENTS_RELOAD_INTERVAL", "2.0"))  # Seconds between mtime checks, 0 disables hot reload
+
+def trie_pattern(keywords) -> str:
+    """
+    Build a regex from a character trie of the keywords, so the engine branches on shared
+    prefixes instead of retrying every alternative at every position
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        is_end = "" in node
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != ""]
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1 and not is_end:
+            return alternatives[0]
+        group = "(?:" + "|".join(alternatives) + ")"
+        # Quantifiers are greedy, so the longest keyword on a path wins
+        return group + "?" if is_end else group
+
+    return build(trie)
+
+class CompiledRules:
+    """
+    Keyword rules of every intent compiled into a single trie-shaped regex
+    """
+    def __init__(self, config: dict):
+        self.keyword_intents = {}
+        self.examples = {}
+        for intent, rule in config.get("intents", {}).items():
+            for keyword in rule.get("keywords", []):
+                self.keyword_intents.setdefault(keyword.lower(), set()).add(intent)
+            if rule.get("examples"):
+                self.examples[intent] = rule["examples"]
+
+        # A zero-width lookahead matches at every position, so keywords that overlap or sit inside
+        # another keyword ("case study" / "study") are all found. At one position the regex reports
+        # the longest keyword only; the shorter keywords starting there are its prefixes, so each
+        # keyword maps to its own intents plus those of every keyword that is a prefix of it.
+        self.pattern = re.compile(f"(?=({trie_pattern(self.keyword_intents)}))") if self.keyword_intents else None
+        self.match_intents = {
+            keyword: set().union(*(self.keyword_intents.get(keyword[:end], ()) for end in range(1, len(keyword) + 1)))
+            for keyword in self.keyword_intents
+        }
+
+        fallback = config.get("embedding_fallback", {})
+        self.fallback_enabled = bool(fallback.get("enabled", False)) and bool(self.examples)
+        self.fallback_threshold = float(fallback.get("threshold", 0.55))
+        self.centroid_intents = []
+        self.centroids = None
+
+    def match(self, text: str):
+        """
+        Every intent whose keywords occur in the text, found in a single scan
+        """
+        if self.pattern is None:
+            return set()
+        intents = set()
+        for found in self.pattern.finditer(text.lower()):
+            intents |= self.match_intents[found.group(1)]
+        return intents
+
+class IntentRouter:
+    """
+    Expert-system router: compiled keyword rules loaded from a JSON file with hot reload,
+    plus an optional embedding-similarity fallback against per-intent centroids for paraphrases
+    """
+    def __init__(self, path: str = INTENTS_CONFIG_PATH, reload_interval: float = INTENTS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.rules = self._load()
+
+    def _load(self) -> CompiledRules:
+        self._mtime = os.path.getmtime(self.path)
+        with open(self.path) as f:
+            rules = CompiledRules(json.load(f))
+        logging.info(f"Loaded {len(rules.keyword_intents)} intent keywords from {self.path}")
+        return rules
+
+    def _maybe_reload(self):
+        if self.reload_interval <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.reload_interval
+            try:
+                if os.path.getmtime(self.path) != self._mtime:
+                    self.rules = self._load()
+            except (OSError, ValueError) as e:
+                # Keep serving the last good rules if the file is missing or half-written
+                logging.error(f"Failed to reload intent rules from {self.path}: {e}")
+
+    def match(self, text: str):
+        """
+        Keyword intents only (no embedding call)
+        """
+        self._maybe_reload()
+        return self.rules.match(text)
+
+    async def _ensure_centroids(self, rules: CompiledRules):
+        if rules.centroids is not None:
+            return
+        intents = list(rules.examples)
+        vectors = await embedding_service.aencode([e for intent in intents for e in rules.examples[intent]])
+        centroids = []
+        offset = 0
+        for intent in intents:
+            count = len(rules.examples[intent])
+            centroid = vectors[offset:offset + count].mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+            offset += count
+        rules.centroid_intents = intents
+        rules.centroids = np.stack(centroids)
+
+    async def route(self, text: str):
+        """
+        Keyword intents, or, if none matched and the fallback is enabled, intents whose
+        example centroid is within the configured cosine similarity of the text
+        """
+        intents = self.match(text)
+        rules = self.rules
+        if intents or not rules.fallback_enabled:
+            return intents
+        try:
+            await self._ensure_centroids(rules)
+            vector = (await embedding_service.aencode([text]))[0]
+        except Exception as e:
+            logging.error(f"Intent embedding fallback failed: {e}")
+            return intents
+        scores = rules.centroids @ (vector / np.linalg.norm(vector))
+        return {intent for intent, score in zip(rules.centroid_intents, scores) if score >= rules.fallback_threshold}
+
+intent_router = IntentRouter()
@@ -0,0 +1,121 @@
+"""
+ONNX Runtime backend for the MiniLM sentence embedder, so serving needs neither PyTorch nor
+sentence-transformers (only onnxruntime and tokenizers).
+
+Export once, where torch and transformers are installed (e.g. a Docker build stage). --int8 also
+writes a dynamically quantised copy (int8 weights, activations quantised at run time):
+
+    python -m backend.onnx_embedder --output ./models/all-MiniLM-L6-v2-onnx --int8
+
+Then select it with EMBEDDING_BACKEND=onnx or EMBEDDING_BACKEND=onnx-int8.
+"""
+import argparse
+import logging
+import os
+import numpy as np
+
+# ====== ONNX Embedder Configuration ======
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+MAX_SEQ_LENGTH = 256  # Truncation used by the sentence-transformers model
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+class OnnxEmbedder:
+    """
+    Transformer forward pass in ONNX Runtime followed by the sentence-transformers head of
+    all-MiniLM-L6-v2: mean pooling over non-padding tokens, then L2 normalisation.
+    """
+    def __init__(self, path: str, quantized: bool = False, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_file = os.path.join(path, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(
+                f"{model_file} not found, export it with: python -m backend.onnx_embedder --output {path}"
+                + (" --int8" if quantized else "")
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1  # A single-branch graph, parallelism comes from intra-op threads
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+    def encode(self, texts, batch_size: int = 32, convert_to_numpy: bool = True) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        # Longest first so each batch pads to similar lengths (as sentence-transformers does)
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            for i, vector in zip(indices, self._encode_batch([texts[i] for i in indices])):
+                vectors[i] = vector
+        return np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+    def _encode_batch(self, texts) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]  # (batch, tokens, dim)
+
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32, copy=False)
+
+def export(model_name: str, output: str, int8: bool = False, opset: int = 14):
+    """
+    Export the Hugging Face transformer to ONNX with dynamic batch and sequence axes, plus its fast tokenizer
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(output)  # Writes tokenizer.json, the only file the runtime tokenizer needs
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["Export sample sentence."], return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES + ("last_hidden_state",)}
+    dynamic_axes["pooler_output"] = {0: "batch"}
+    fp32_path = os.path.join(output, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in INPUT_NAMES), fp32_path,
+            input_names=list(INPUT_NAMES), output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes=dynamic_axes, opset_version=opset, do_constant_folding=True,
+        )
+    logging.info(f"Exported {model_name} to {fp32_path}")
+
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(output, INT8_FILE)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        logging.info(f"Wrote dynamically quantised model to {int8_path}")
+
+def main():
+    from backend.embeddings import EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--output", default=EMBEDDING_ONNX_PATH, help="Directory (default EMBEDDING_ONNX_PATH)")
+    parser.add_argument("--int8", action="store_true", help="Also write a dynamically quantised int8 model")
+    parser.add_argument("--opset", type=int, default=14)
+    args = parser.parse_args()
+    export(args.model, args.output, int8=args.int8, opset=args.opset)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ====== Profile Cache Configuration ======
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000"))  # 0 disables the cache
+# Invalidation is per process, so the TTL bounds how long other workers (or the CLI removing a user) can lag behind
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+
+class ProfileCache:
+    """
+    Thread-safe read-through LRU of user rows keyed by username.
+
+    Readers take a generation with `begin()` before querying the database and pass it to `set()`;
+    an `invalidate()` in between bumps the generation, so a read that raced with a write can never
+    put the old row back into the cache.
+    """
+    def __init__(self, max_entries: int = PROFILE_CACHE_MAX_ENTRIES, ttl: float = PROFILE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+        self._items = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, username: str):
+        with self._lock:
+            entry = self._items.get(username)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self._items[username]
+                self.counters["misses"] += 1
+                return None
+            self._items.move_to_end(username)
+            self.counters["hits"] += 1
+            return entry[0]
+
+    def begin(self, username: str) -> int:
+        with self._lock:
+            return self._generations.get(username, 0)
+
+    def set(self, username: str, record, generation: int):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if self._generations.get(username, 0) != generation:
+                return
+            self._items[username] = (record, time.time() + self.ttl)
+            self._items.move_to_end(username)
+            while len(self._items) > self.max_entries:
+                evicted, _ = self._items.popitem(last=False)
+                self._generations.pop(evicted, None)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._items.pop(username, None)
+            self._generations[username] = self._generations.get(username, 0) + 1
+            self.counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "entries": len(self._items)}
+
+profile_cache = ProfileCache()
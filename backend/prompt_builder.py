@@ -0,0 +1,125 @@
+import math
+import os
+import re
+from collections import namedtuple
+from backend.metrics import Histogram
+from backend.vector_ids import PROFILE_PREFIX
+
+# ====== Prompt Budget Configuration ======
+PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", "1200"))  # Retrieved context, excluding the question
+PROMPT_SNIPPET_MAX_TOKENS = int(os.getenv("PROMPT_SNIPPET_MAX_TOKENS", "300"))  # Cap per history message or abstract
+PROMPT_SNIPPET_MIN_TOKENS = 40  # Smaller leftovers are dropped rather than cut to a fragment
+PROMPT_HISTORY_MIN_SCORE = float(os.getenv("PROMPT_HISTORY_MIN_SCORE", "0.3"))  # Cosine similarity for past messages
+PROMPT_DEDUP_OVERLAP = float(os.getenv("PROMPT_DEDUP_OVERLAP", "0.7"))  # Shingle containment above which a snippet is a duplicate
+
+PROFILE = "profile"
+HISTORY = "history"
+PUBMED = "pubmed"
+SECTION_TITLES = {
+    PROFILE: "### User Profile:",
+    HISTORY: "### Previous Conversations:",
+    PUBMED: "### Relevant Research from PubMed:",
+}
+
+PROMPT_CONTEXT_TOKENS = Histogram(
+    "prompt_context_tokens", "Estimated tokens of retrieved context sent to the LLM",
+    buckets=(0, 64, 128, 256, 512, 768, 1024, 1536, 2048, 4096),
+)
+
+Snippet = namedtuple("Snippet", "section text score")
+
+_CJK = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer: about one token per CJK character and per four other characters
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Shorten text to roughly `max_tokens`, preferring to cut at a sentence boundary
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept = ""
+    for sentence in _SENTENCE_END.split(text):
+        candidate = f"{kept} {sentence}" if kept else sentence
+        if estimate_tokens(candidate) > max_tokens:
+            break
+        kept = candidate
+    if not kept:
+        # A single long sentence, cut by characters (estimate is at least one token per four characters)
+        kept = text[:max_tokens * 4]
+        while kept and estimate_tokens(kept) > max_tokens:
+            kept = kept[:int(len(kept) * 0.9)]
+    return kept.rstrip() + " …"
+
+def _shingles(text: str, size: int = 3):
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _overlap(a, b) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+def lexical_relevance(question: str, text: str) -> float:
+    """
+    Share of the question's words that occur in the text (0..1)
+    """
+    question_words = {w for w in _WORD.findall(question.lower()) if len(w) > 2}
+    if not question_words:
+        return 0.0
+    return len(question_words & set(_WORD.findall(text.lower()))) / len(question_words)
+
+def collect_snippets(question: str, history_matches, articles, format_article):
+    """
+    Turn retrieval results into scored snippets. History matches are {"id", "text", "score"} dicts
+    (the stored profile has the id "profile-{username}"); articles keep their search order as a tie-breaker.
+    """
+    snippets = []
+    for match in history_matches:
+        if match["id"].startswith(PROFILE_PREFIX):
+            snippets.append(Snippet(PROFILE, match["text"], float("inf")))
+        elif match["score"] >= PROMPT_HISTORY_MIN_SCORE:
+            snippets.append(Snippet(HISTORY, match["text"], match["score"]))
+    for rank, article in enumerate(articles):
+        text = format_article(article)
+        snippets.append(Snippet(PUBMED, text, lexical_relevance(question, text) - rank * 0.01))
+    return snippets
+
+def build_context(snippets, budget: int = PROMPT_CONTEXT_TOKEN_BUDGET, snippet_max_tokens: int = PROMPT_SNIPPET_MAX_TOKENS) -> str:
+    """
+    Pack the most relevant snippets into at most `budget` estimated tokens: highest score first,
+    near-duplicates skipped, each snippet capped at `snippet_max_tokens`. Output is grouped by section.
+    """
+    selected = {section: [] for section in SECTION_TITLES}
+    seen = []
+    remaining = budget
+    for snippet in sorted(snippets, key=lambda s: -s.score):
+        shingles = _shingles(snippet.text)
+        if any(_overlap(shingles, other) >= PROMPT_DEDUP_OVERLAP for other in seen):
+            continue
+        if not selected[snippet.section]:
+            remaining -= estimate_tokens(SECTION_TITLES[snippet.section])
+        allowance = min(snippet_max_tokens, remaining)
+        if allowance < PROMPT_SNIPPET_MIN_TOKENS and estimate_tokens(snippet.text) > allowance:
+            if not selected[snippet.section]:
+                remaining += estimate_tokens(SECTION_TITLES[snippet.section])
+            continue
+        text = truncate_to_tokens(snippet.text, allowance)
+        remaining -= estimate_tokens(text)
+        selected[snippet.section].append(text)
+        seen.append(shingles)
+
+    context = "\n".join(
+        SECTION_TITLES[section] + "\n" + "\n".join(texts) for section, texts in selected.items() if texts
+    )
+    PROMPT_CONTEXT_TOKENS.observe(estimate_tokens(context))
+    return context
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ====== Cache Configuration ======
+PUBMED_CACHE_PATH = os.getenv("PUBMED_CACHE_PATH", "./pubmed_cache.db")  # Empty string disables the disk tier
+PUBMED_CACHE_MEMORY_ENTRIES = int(os.getenv("PUBMED_CACHE_MEMORY_ENTRIES", "2048"))
+PUBMED_SEARCH_TTL = float(os.getenv("PUBMED_SEARCH_TTL", str(6 * 3600)))  # esearch ID lists (seconds)
+PUBMED_ARTICLE_TTL = float(os.getenv("PUBMED_ARTICLE_TTL", str(7 * 24 * 3600)))  # Parsed article records (seconds)
+
+SEARCH = "search"
+ARTICLE = "article"
+BOOLEAN_OPERATORS = ("AND", "OR", "NOT")  # PubMed only treats the uppercase words as operators
+
+def collapse_whitespace(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip()
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key form of a query: whitespace collapsed and case folded, except for boolean operators,
+    so trivially different spellings share one entry but queries PubMed reads differently do not
+    """
+    return " ".join(word if word in BOOLEAN_OPERATORS else word.lower() for word in collapse_whitespace(query).split(" "))
+
+class MemoryLRU:
+    """
+    Bounded in-memory LRU with per-entry expiry
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, expires_at: float):
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+class DiskStore:
+    """
+    SQLite-backed persistent tier that survives restarts
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pubmed_cache ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (kind, key))"
+            )
+            self._conn.execute("DELETE FROM pubmed_cache WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+        return self._conn
+
+    def get_many(self, kind: str, keys):
+        """
+        Return {key: (value, expires_at)} for the unexpired keys found on disk
+        """
+        if not keys:
+            return {}
+        with self._lock:
+            conn = self._connect()
+            placeholders = ",".join("?" * len(keys))
+            rows = conn.execute(
+                f"SELECT key, value, expires_at FROM pubmed_cache WHERE kind = ? AND key IN ({placeholders}) AND expires_at >= ?",
+                (kind, *keys, time.time()),
+            ).fetchall()
+        return {key: (json.loads(value), expires_at) for key, value, expires_at in rows}
+
+    def set_many(self, kind: str, items):
+        """
+        Write (key, value, expires_at) triples in one transaction
+        """
+        if not items:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO pubmed_cache (kind, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                [(kind, key, json.dumps(value), expires_at) for key, value, expires_at in items],
+            )
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class PubMedCache:
+    """
+    Two-tier cache for esearch ID lists and per-PMID article records, with single-flight coalescing
+    """
+    def __init__(self, path: str = PUBMED_CACHE_PATH, memory_entries: int = PUBMED_CACHE_MEMORY_ENTRIES,
+                 search_ttl: float = PUBMED_SEARCH_TTL, article_ttl: float = PUBMED_ARTICLE_TTL):
+        self.ttls = {SEARCH: search_ttl, ARTICLE: article_ttl}
+        self.memory = {SEARCH: MemoryLRU(memory_entries), ARTICLE: MemoryLRU(memory_entries)}
+        self.disk = DiskStore(path) if path else None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "disk_errors": 0}
+        self._inflight = {}
+
+    async def get_many(self, kind: str, keys):
+        """
+        Look keys up in memory, then on disk (promoting disk hits). Returns {key: value} for hits only
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.memory[kind].get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        self.counters["memory_hits"] += len(found)
+
+        if missing and self.disk is not None:
+            try:
+                on_disk = await asyncio.to_thread(self.disk.get_many, kind, missing)
+            except sqlite3.Error as e:
+                self.counters["disk_errors"] += 1
+                logging.error(f"PubMed cache disk read failed: {e}")
+                on_disk = {}
+            for key, (value, expires_at) in on_disk.items():
+                self.memory[kind].set(key, value, expires_at)
+                found[key] = value
+            self.counters["disk_hits"] += len(on_disk)
+
+        self.counters["misses"] += len(keys) - len(found)
+        return found
+
+    async def set_many(self, kind: str, items):
+        """
+        Store a {key: value} mapping in both tiers
+        """
+        expires_at = time.time() + self.ttls[kind]
+        for key, value in items.items():
+            self.memory[kind].set(key, value, expires_at)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set_many, kind, [(k, v, expires_at) for k, v in items.items()])
+            except sqlite3.Error as e:
+                self.counters["disk_errors"] += 1
+                logging.error(f"PubMed cache disk write failed: {e}")
+
+    async def single_flight(self, key, factory):
+        """
+        Run `factory()` once per key; concurrent callers with the same key share its result
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one caller's timeout does not cancel the upstream call for everyone else
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """
+        Hit/miss/eviction counters and current tier sizes
+        """
+        return {
+            **self.counters,
+            "evictions": sum(lru.evictions for lru in self.memory.values()),
+            "memory_entries": {kind: len(lru) for kind, lru in self.memory.items()},
+            "inflight": len(self._inflight),
+            "disk_enabled": self.disk is not None,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+pubmed_cache = PubMedCache()
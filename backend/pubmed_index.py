@@ -0,0 +1,319 @@
+"""
+Local PubMed abstract index: BM25 search over ingested baseline/update XML, with optional dense re-ranking.
+
+    python -m backend.pubmed_index ingest pubmed25n0001.xml.gz pubmed25n0002.xml.gz [--embed]
+    python -m backend.pubmed_index search "statins and muscle pain"
+    python -m backend.pubmed_index stats
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+from backend.embeddings import embedding_service
+from backend.metrics import stage
+from backend.pubmed_xml import iter_pubmed_file
+
+# ====== Local Index Configuration ======
+PUBMED_INDEX_PATH = os.getenv("PUBMED_INDEX_PATH", "")  # SQLite file of the index; empty disables local search
+PUBMED_INDEX_CANDIDATES = int(os.getenv("PUBMED_INDEX_CANDIDATES", "50"))  # BM25 candidates considered per query
+PUBMED_INDEX_MIN_COVERAGE = float(os.getenv("PUBMED_INDEX_MIN_COVERAGE", "0.6"))  # Share of query terms an article must contain
+PUBMED_INDEX_RERANK = os.getenv("PUBMED_INDEX_RERANK", "false").lower() == "true"  # Re-rank candidates with MiniLM
+PUBMED_INDEX_TITLE_WEIGHT = 2.0
+PUBMED_INDEX_MAX_TERMS = 16
+PUBMED_INDEX_INGEST_BATCH = 1000
+
+STOPWORDS = frozenset(
+    "a about an and any are as at be been but by can could did do does for from had has have how i if in into is it its "
+    "me my of on or our should so than that the their them then there these they this those to was we were what when "
+    "where which who why will with would you your".split()
+)
+
+def query_terms(query: str):
+    """
+    Lowercased content words of a query, deduplicated in order
+    """
+    terms = [t for t in re.findall(r"[a-z0-9]+", query.lower()) if t not in STOPWORDS and len(t) > 1]
+    return list(dict.fromkeys(terms))[:PUBMED_INDEX_MAX_TERMS]
+
+def _fts_term(term: str) -> str:
+    return f'"{term}"'
+
+class PubMedIndex:
+    """
+    Inverted index of PubMed titles and abstracts in an SQLite FTS5 table (porter-stemmed,
+    BM25-ranked), keyed by PMID so update files can replace or delete citations in place.
+    Files that were already ingested are skipped, so re-running ingest over a growing
+    directory of update files only processes the new ones.
+    """
+    def __init__(self, path: str = PUBMED_INDEX_PATH, candidates: int = PUBMED_INDEX_CANDIDATES,
+                 min_coverage: float = PUBMED_INDEX_MIN_COVERAGE, rerank: bool = PUBMED_INDEX_RERANK):
+        self.path = path
+        self.candidates = candidates
+        self.min_coverage = min_coverage
+        self.rerank = rerank
+        self.counters = {"queries": 0, "hits": 0, "misses": 0, "reranked": 0}
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS articles USING fts5(title, abstract, tokenize='porter unicode61')"
+            )
+            # Unit-length float16 MiniLM vectors, only filled by `ingest --embed` or lazily by re-ranking
+            self._conn.execute("CREATE TABLE IF NOT EXISTS article_vectors (pmid INTEGER PRIMARY KEY, vector BLOB NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ingested_files ("
+                "name TEXT PRIMARY KEY, size INTEGER NOT NULL, upserted INTEGER NOT NULL, deleted INTEGER NOT NULL, ingested_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    # ====== Ingest ======
+    def _write_batch(self, conn, upserts, deletes, vectors):
+        if deletes:
+            conn.executemany("DELETE FROM articles WHERE rowid = ?", [(pmid,) for pmid in deletes])
+            conn.executemany("DELETE FROM article_vectors WHERE pmid = ?", [(pmid,) for pmid in deletes])
+        if upserts:
+            conn.executemany("DELETE FROM articles WHERE rowid = ?", [(pmid,) for pmid, _, _ in upserts])
+            conn.executemany("INSERT INTO articles (rowid, title, abstract) VALUES (?, ?, ?)", upserts)
+            conn.executemany("DELETE FROM article_vectors WHERE pmid = ?", [(pmid,) for pmid, _, _ in upserts])
+        if vectors:
+            conn.executemany("INSERT OR REPLACE INTO article_vectors (pmid, vector) VALUES (?, ?)", vectors)
+
+    def ingest_file(self, path: str, embed: bool = False, force: bool = False, batch_size: int = PUBMED_INDEX_INGEST_BATCH):
+        """
+        Add, replace and delete the citations of one PubMed XML file. Returns (upserted, deleted),
+        or None if the file was already ingested (unless `force`).
+        """
+        name = os.path.basename(path)
+        with self._lock:
+            conn = self._connect()
+            if not force and conn.execute("SELECT 1 FROM ingested_files WHERE name = ?", (name,)).fetchone():
+                return None
+
+        upserted = deleted = 0
+        # Within a batch deletions are applied before insertions, so the last action per PMID must win here
+        upserts, deletes = {}, set()
+
+        def flush():
+            rows = [(pmid, title, abstract) for pmid, (title, abstract) in upserts.items()]
+            vectors = []
+            if embed and rows:
+                encoded = embedding_service.encode([article_text(title, abstract) for _, title, abstract in rows])
+                vectors = [(pmid, _to_blob(vector)) for (pmid, _, _), vector in zip(rows, encoded)]
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    self._write_batch(conn, rows, sorted(deletes), vectors)
+            upserts.clear()
+            deletes.clear()
+
+        for action, value in iter_pubmed_file(path):
+            if action == "upsert":
+                if not value["pmid"]:
+                    continue
+                upserts[int(value["pmid"])] = (value["title"], value["abstract"])
+                upserted += 1
+            else:
+                upserts.pop(int(value), None)
+                deletes.add(int(value))
+                deleted += 1
+            if len(upserts) + len(deletes) >= batch_size:
+                flush()
+        flush()
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ingested_files (name, size, upserted, deleted, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                    (name, os.path.getsize(path), upserted, deleted, time.time()),
+                )
+        return upserted, deleted
+
+    def optimize(self):
+        """
+        Merge the FTS5 index segments written by incremental ingests
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT INTO articles (articles) VALUES ('optimize')")
+            conn.commit()
+
+    # ====== Search ======
+    def _candidates(self, terms):
+        """
+        BM25 candidates as (pmid, title, abstract, coverage), best first, filtered by term coverage
+        """
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT rowid, title, abstract FROM articles WHERE articles MATCH ? "
+                f"ORDER BY bm25(articles, {PUBMED_INDEX_TITLE_WEIGHT}, 1.0) LIMIT ?",
+                (" OR ".join(_fts_term(t) for t in terms), self.candidates),
+            ).fetchall()
+            if not rows:
+                return []
+            # Count how many query terms each candidate contains (stemmed, as the index sees them)
+            rowids = [row[0] for row in rows]
+            placeholders = ",".join("?" * len(rowids))
+            matched = dict.fromkeys(rowids, 0)
+            for term in terms:
+                for (rowid,) in conn.execute(
+                    f"SELECT rowid FROM articles WHERE articles MATCH ? AND rowid IN ({placeholders})", (_fts_term(term), *rowids)
+                ):
+                    matched[rowid] += 1
+        return [
+            (rowid, title, abstract, matched[rowid] / len(terms))
+            for rowid, title, abstract in rows
+            if matched[rowid] / len(terms) >= self.min_coverage
+        ]
+
+    def _stored_vectors(self, pmids):
+        with self._lock:
+            conn = self._connect()
+            placeholders = ",".join("?" * len(pmids))
+            rows = conn.execute(f"SELECT pmid, vector FROM article_vectors WHERE pmid IN ({placeholders})", pmids).fetchall()
+        return {pmid: np.frombuffer(blob, dtype=np.float16).astype(np.float32) for pmid, blob in rows}
+
+    def _store_vectors(self, vectors):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO article_vectors (pmid, vector) VALUES (?, ?)",
+                                 [(pmid, _to_blob(vector)) for pmid, vector in vectors.items()])
+
+    def _rank(self, candidates, query_vector, doc_vectors, limit: int):
+        if query_vector is not None:
+            query_vector = _unit(query_vector)
+            candidates = sorted(candidates, key=lambda c: -float(doc_vectors[c[0]] @ query_vector))
+            self.counters["reranked"] += 1
+        return [{"pmid": str(pmid), "title": title, "abstract": abstract} for pmid, title, abstract, _ in candidates[:limit]]
+
+    def _count(self, results):
+        self.counters["hits" if results else "misses"] += 1
+        return results
+
+    def search(self, query: str, limit: int):
+        """
+        Blocking search returning up to `limit` article records ({"pmid", "title", "abstract"})
+        """
+        self.counters["queries"] += 1
+        terms = query_terms(query)
+        candidates = self._candidates(terms) if terms else []
+        if not candidates or not self.rerank:
+            return self._count(self._rank(candidates, None, None, limit))
+        doc_vectors = self._stored_vectors([c[0] for c in candidates])
+        missing = [c for c in candidates if c[0] not in doc_vectors]
+        texts = [query] + [article_text(title, abstract) for _, title, abstract, _ in missing]
+        encoded = embedding_service.encode(texts)
+        new_vectors = {c[0]: _unit(vector) for c, vector in zip(missing, encoded[1:])}
+        if new_vectors:
+            self._store_vectors(new_vectors)
+        return self._count(self._rank(candidates, encoded[0], {**doc_vectors, **new_vectors}, limit))
+
+    async def asearch(self, query: str, limit: int):
+        """
+        search() for the event loop: SQLite work runs in a thread, embeddings go through the shared batcher
+        """
+        self.counters["queries"] += 1
+        terms = query_terms(query)
+        with stage("pubmed_local_search"):
+            candidates = await asyncio.to_thread(self._candidates, terms) if terms else []
+        if not candidates or not self.rerank:
+            return self._count(self._rank(candidates, None, None, limit))
+        with stage("pubmed_local_rerank"):
+            doc_vectors = await asyncio.to_thread(self._stored_vectors, [c[0] for c in candidates])
+            missing = [c for c in candidates if c[0] not in doc_vectors]
+            texts = [query] + [article_text(title, abstract) for _, title, abstract, _ in missing]
+            encoded = await embedding_service.aencode(texts)
+            new_vectors = {c[0]: _unit(vector) for c, vector in zip(missing, encoded[1:])}
+            if new_vectors:
+                await asyncio.to_thread(self._store_vectors, new_vectors)
+            return self._count(self._rank(candidates, encoded[0], {**doc_vectors, **new_vectors}, limit))
+
+    def index_stats(self):
+        """
+        Document, vector and file counts (scans the index, for the CLI rather than /metrics)
+        """
+        with self._lock:
+            conn = self._connect()
+            return {
+                "articles": conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0],
+                "vectors": conn.execute("SELECT COUNT(*) FROM article_vectors").fetchone()[0],
+                "files": conn.execute("SELECT COUNT(*) FROM ingested_files").fetchone()[0],
+            }
+
+    def stats(self):
+        return dict(self.counters)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def article_text(title: str, abstract: str) -> str:
+    return f"{title}\n{abstract}"
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+def _to_blob(vector) -> bytes:
+    return _unit(vector).astype(np.float16).tobytes()
+
+pubmed_index = PubMedIndex() if PUBMED_INDEX_PATH else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=PUBMED_INDEX_PATH or "./pubmed_index.db", help="Index file (default PUBMED_INDEX_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Ingest PubMed XML files (.xml or .xml.gz) in the given order")
+    ingest.add_argument("files", nargs="+")
+    ingest.add_argument("--embed", action="store_true", help="Also store MiniLM vectors for dense re-ranking")
+    ingest.add_argument("--force", action="store_true", help="Re-ingest files that were already ingested")
+    search = commands.add_parser("search", help="Run a query against the index")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=5)
+    search.add_argument("--rerank", action="store_true")
+    commands.add_parser("stats", help="Show index size")
+    commands.add_parser("optimize", help="Merge index segments after large ingests")
+    args = parser.parse_args()
+
+    index = PubMedIndex(args.index, rerank=getattr(args, "rerank", False))
+    if args.command == "ingest":
+        for path in args.files:
+            start = time.perf_counter()
+            result = index.ingest_file(path, embed=args.embed, force=args.force)
+            if result is None:
+                print(f"{path}: already ingested, skipped")
+                continue
+            upserted, deleted = result
+            elapsed = time.perf_counter() - start
+            print(f"{path}: {upserted} articles added or replaced, {deleted} deleted in {elapsed:.1f}s ({upserted / max(elapsed, 1e-9):.0f} articles/s)")
+    elif args.command == "search":
+        start = time.perf_counter()
+        results = index.search(args.query, args.limit)
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for article in results:
+            print(f"- [{article['pmid']}] {article['title']}")
+    elif args.command == "stats":
+        print(index.index_stats())
+    elif args.command == "optimize":
+        index.optimize()
+    index.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
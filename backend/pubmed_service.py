@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+from xml.etree import ElementTree as ET
+from backend.pubmed_xml import ArticleStreamParser
+from backend.http_clients import get_client, NCBI
+from backend.pubmed_index import pubmed_index
+from backend.pubmed_cache import pubmed_cache, normalize_query, collapse_whitespace, SEARCH, ARTICLE
+from backend.metrics import stage
+from backend.upstream import get_upstream, detach_deadline, is_retryable_status, RetryableStatus, UpstreamError
+
+# ====== NCBI E-utilities Configuration ======
+PUBMED_API_BASE_URL = os.getenv("PUBMED_API_BASE_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/")
+PUBMED_MAX_RESULTS = int(os.getenv("PUBMED_MAX_RESULTS", "3"))
+PUBMED_REQUEST_TIMEOUT = 5.0  # Per NCBI call (seconds)
+PUBMED_EFETCH_BATCH_WINDOW_MS = float(os.getenv("PUBMED_EFETCH_BATCH_WINDOW_MS", "10"))  # How long missing PMIDs wait for other requests
+PUBMED_EFETCH_MAX_IDS = int(os.getenv("PUBMED_EFETCH_MAX_IDS", "200"))  # PMIDs per efetch call
+PUBMED_HEDGE = os.getenv("PUBMED_HEDGE", "true").lower() == "true"  # Hedge esearch/efetch calls slower than the p95 latency
+
+class PubMedError(Exception):
+    """
+    Raised when NCBI cannot be reached or returns an error status
+    """
+
+async def esearch(query: str, max_results: int = PUBMED_MAX_RESULTS):
+    """
+    Return the list of PMIDs matching the query
+    """
+    params = {
+        "db": "pubmed",
+        "term": query,
+        "retmode": "json",
+        "retmax": max_results
+    }
+
+    async def op(timeout):
+        response = await get_client(NCBI).get(f"{PUBMED_API_BASE_URL}esearch.fcgi", params=params, timeout=timeout)
+        if is_retryable_status(response.status_code):
+            raise RetryableStatus(response.status_code)
+        if response.status_code != 200:
+            raise PubMedError(f"Error querying PubMed: {response.status_code}")
+        return response.json().get("esearchresult", {}).get("idlist", [])
+
+    try:
+        with stage("pubmed_esearch"):
+            return await get_upstream(NCBI).call(op, PUBMED_REQUEST_TIMEOUT, idempotent=True, hedge=PUBMED_HEDGE)
+    except UpstreamError as e:
+        raise PubMedError(f"Error querying PubMed: {e}") from e
+
+async def efetch(pubmed_ids):
+    """
+    Fetch the article records for the given PMIDs, parsing the XML while it streams in
+    """
+    params = {
+        "db": "pubmed",
+        "id": ",".join(pubmed_ids),
+        "retmode": "xml"
+    }
+
+    async def op(timeout):
+        # A fresh parser per attempt, retries and hedges must not share partial state
+        parser = ArticleStreamParser()
+        articles = []
+        async with get_client(NCBI).stream("GET", f"{PUBMED_API_BASE_URL}efetch.fcgi", params=params, timeout=timeout) as response:
+            if is_retryable_status(response.status_code):
+                raise RetryableStatus(response.status_code)
+            if response.status_code != 200:
+                raise PubMedError(f"Error fetching abstracts: {response.status_code}")
+            async for chunk in response.aiter_bytes():
+                articles.extend(parser.feed(chunk))
+        articles.extend(parser.close())
+        return articles
+
+    try:
+        with stage("pubmed_efetch"):
+            return await get_upstream(NCBI).call(op, PUBMED_REQUEST_TIMEOUT, idempotent=True, hedge=PUBMED_HEDGE)
+    except UpstreamError as e:
+        raise PubMedError(f"Error fetching abstracts: {e}") from e
+    except ET.ParseError as e:
+        raise PubMedError(f"Malformed efetch response: {e}") from e
+
+class EfetchBatcher:
+    """
+    Coalesces the PMIDs that concurrent requests are missing into shared efetch calls.
+
+    PMIDs requested within PUBMED_EFETCH_BATCH_WINDOW_MS of each other go upstream in one call
+    (at most PUBMED_EFETCH_MAX_IDS per call), and a PMID that is already pending or in flight
+    is awaited instead of fetched again. Fetched records are written to the PubMed cache.
+    """
+    def __init__(self, window_ms: float = PUBMED_EFETCH_BATCH_WINDOW_MS, max_ids: int = PUBMED_EFETCH_MAX_IDS):
+        self.window = window_ms / 1000.0
+        self.max_ids = max_ids
+        self.counters = {"batches": 0, "ids_fetched": 0, "ids_coalesced": 0, "batch_errors": 0}
+        self._pending = {}
+        self._inflight = {}
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def fetch(self, pubmed_ids):
+        """
+        Return {pmid: record} for the requested PMIDs that PubMed knows about
+        """
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for pmid in pubmed_ids:
+            future = self._pending.get(pmid) or self._inflight.get(pmid)
+            if future is None:
+                future = loop.create_future()
+                # Mark failures as retrieved, callers that timed out will never look at them
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self._pending[pmid] = future
+            else:
+                self.counters["ids_coalesced"] += 1
+            futures[pmid] = future
+
+        if len(self._pending) >= self.max_ids:
+            self._flush()
+        elif self._pending and self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+
+        # Shield so one caller's timeout does not cancel a batch that other requests are waiting on
+        records = await asyncio.gather(*(asyncio.shield(future) for future in futures.values()))
+        return {pmid: record for pmid, record in zip(futures, records) if record is not None}
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch = dict(list(self._pending.items())[:self.max_ids])
+            for pmid in batch:
+                del self._pending[pmid]
+            self._inflight.update(batch)
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        # The batch serves every waiting request, not only the one whose context started it
+        detach_deadline()
+        try:
+            fetched = {a["pmid"]: a for a in await efetch(list(batch)) if a["pmid"]}
+            self.counters["batches"] += 1
+            self.counters["ids_fetched"] += len(batch)
+            await pubmed_cache.set_many(ARTICLE, fetched)
+            for pmid, future in batch.items():
+                if not future.done():
+                    future.set_result(fetched.get(pmid))
+        except Exception as e:
+            self.counters["batch_errors"] += 1
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for pmid in batch:
+                self._inflight.pop(pmid, None)
+
+    def stats(self):
+        return {**self.counters, "pending": len(self._pending), "inflight": len(self._inflight)}
+
+efetch_batcher = EfetchBatcher()
+
+async def cached_esearch(query: str, max_results: int = PUBMED_MAX_RESULTS):
+    """
+    esearch through the two-tier cache, keyed by normalized query
+    """
+    key = f"{max_results}:{normalize_query(query)}"
+    cached = await pubmed_cache.get_many(SEARCH, [key])
+    if key in cached:
+        return cached[key]
+
+    async def load():
+        pubmed_ids = await esearch(collapse_whitespace(query), max_results)
+        await pubmed_cache.set_many(SEARCH, {key: pubmed_ids})
+        return pubmed_ids
+
+    return await pubmed_cache.single_flight((SEARCH, key), load)
+
+async def cached_efetch(pubmed_ids):
+    """
+    efetch through the two-tier cache; only PMIDs missing from both tiers go upstream, batched with other requests
+    """
+    articles = await pubmed_cache.get_many(ARTICLE, pubmed_ids)
+    missing = [pmid for pmid in dict.fromkeys(pubmed_ids) if pmid not in articles]
+    if missing:
+        articles.update(await efetch_batcher.fetch(missing))
+    return [articles[pmid] for pmid in pubmed_ids if pmid in articles]
+
+async def search_pubmed(query: str, max_results: int = PUBMED_MAX_RESULTS):
+    """
+    Search PubMed and return structured article records ({"pmid", "title", "abstract"}).
+    The local index (PUBMED_INDEX_PATH) is tried first; NCBI is only queried when it has no match.
+    """
+    if pubmed_index is not None:
+        try:
+            articles = await pubmed_index.asearch(query, max_results)
+        except Exception as e:
+            logging.error(f"Local PubMed index search failed, falling back to NCBI: {e}")
+            articles = []
+        if articles:
+            logging.info(f"Local PubMed index returned {len(articles)} articles for query={query!r}")
+            return articles
+
+    pubmed_ids = await cached_esearch(query, max_results)
+    if not pubmed_ids:
+        return []
+    articles = await cached_efetch(pubmed_ids)
+    logging.info(f"PubMed returned {len(articles)} articles for query={query!r}")
+    return articles
+
+def format_article(article) -> str:
+    """
+    Render an article record as a markdown snippet for prompts and the HTTP API
+    """
+    return f"- **{article['title']}**\nAbstract: {article['abstract']}"
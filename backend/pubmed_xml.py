@@ -0,0 +1,89 @@
+import gzip
+from xml.etree import ElementTree as ET
+
+# ====== PubMed XML ======
+# Shared by the efetch client (response streams) and the local index (baseline/update files)
+
+class ArticleStreamParser:
+    """
+    Incremental efetch parser: feed response chunks as they arrive and collect finished article
+    records. Each PubmedArticle is dropped from the tree once converted, so memory stays flat
+    however many articles the response holds.
+    """
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+
+    def feed(self, chunk: bytes):
+        self._parser.feed(chunk)
+        return self._drain()
+
+    def close(self):
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self):
+        articles = []
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+            elif elem.tag == "PubmedArticle":
+                articles.append(article_record(elem))
+                # Everything before this point has been consumed, release it
+                self._root.clear()
+        return articles
+
+def element_text(elem) -> str:
+    """
+    Text of an element including inline markup such as <i> or <sup>
+    """
+    return "".join(elem.itertext()).strip()
+
+def article_record(article):
+    """
+    Convert a PubmedArticle element into {"pmid", "title", "abstract"}, keeping every section of structured abstracts
+    """
+    pmid_elem = article.find("MedlineCitation/PMID")
+    title_elem = article.find(".//ArticleTitle")
+    sections = []
+    for abstract_text in article.iterfind(".//Abstract/AbstractText"):
+        text = element_text(abstract_text)
+        if not text:
+            continue
+        label = abstract_text.get("Label")
+        sections.append(f"{label}: {text}" if label else text)
+    return {
+        "pmid": pmid_elem.text if pmid_elem is not None else None,
+        "title": (element_text(title_elem) if title_elem is not None else None) or "No title",
+        "abstract": "\n".join(sections) or "No abstract available",
+    }
+
+def parse_articles(xml_text):
+    """
+    Parse a complete efetch XML document into article records
+    """
+    parser = ArticleStreamParser()
+    articles = parser.feed(xml_text.encode("utf-8") if isinstance(xml_text, str) else xml_text)
+    return articles + parser.close()
+
+def iter_pubmed_file(path: str):
+    """
+    Stream a PubMed baseline/update file (optionally .gz) as ("upsert", record) and ("delete", pmid)
+    events, in document order, without holding more than one article in memory
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        root = None
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == "PubmedArticle":
+                yield "upsert", article_record(elem)
+                root.clear()
+            elif elem.tag == "DeleteCitation":
+                for pmid in elem.iterfind("PMID"):
+                    yield "delete", pmid.text
+                root.clear()
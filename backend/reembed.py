@@ -0,0 +1,269 @@
+"""
+Offline re-embedding of every stored vector, for embedding model or vector store index changes.
+
+Profiles are read from the users database and chat messages from the chat log, the sources of
+truth for everything written since the chat log was introduced. Chat vectors written before it
+(ids like user-<username>-<first chars of the message>) are only in the vector store, so the
+legacy source enumerates the source store (index.list + fetch on Pinecone serverless indexes) and
+re-embeds those vectors from their metadata text under the same ids. It is a one-off pass: nothing
+writes legacy ids any more. Texts are encoded in large batches across a process pool and upserted
+in bulk into the target store. The checkpoint file records the last upserted row of each source
+(the namespace for legacy), so an interrupted run resumes where it stopped and a later run only
+picks up chat messages appended since.
+
+    python -m backend.reembed --target-index healthassistant-v2 --workers 4
+    python -m backend.reembed --target-backend local --target-path ./vector_store_v2
+    python -m backend.reembed --sources legacy --source-backend local --source-path ./vector_store --target-index healthassistant-v2
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from backend.chat_log import chat_log
+from backend.embeddings import (EMBEDDING_MODEL_NAME, EMBEDDING_DIMENSION, EMBEDDING_BACKEND, EMBEDDING_BACKENDS,
+                                load_embedding_model)
+from backend.vector_ids import PROFILE_PREFIX, profile_text, profile_vector_id, chat_vector_id
+from backend.vector_store import (LocalVectorStore, PineconeVectorStore, VECTOR_STORE_BACKEND, VECTOR_STORE_PATH,
+                                  INDEX_NAME, PINECONE_INDEX_HOST)
+
+load_dotenv()
+
+# ====== Re-embedding Configuration ======
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "512"))  # Texts per encode job sent to a worker process
+REEMBED_WORKERS = int(os.getenv("REEMBED_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))  # 0 encodes in this process
+REEMBED_UPSERT_BATCH = int(os.getenv("REEMBED_UPSERT_BATCH", "100"))  # Vectors per upsert request
+REEMBED_UPSERT_WORKERS = int(os.getenv("REEMBED_UPSERT_WORKERS", "8"))  # Concurrent upsert requests (one namespace per user)
+REEMBED_CHECKPOINT = os.getenv("REEMBED_CHECKPOINT", "./reembed_checkpoint.json")
+MODEL_BATCH_SIZE = 64  # Texts per forward pass inside an encode job
+USERS_DB_PATH = os.getenv("DATABASE_URL", "sqlite:///./users.db").replace("sqlite:///", "", 1)
+
+PROFILES = "profiles"
+CHAT = "chat"
+LEGACY = "legacy"
+SOURCES = (PROFILES, CHAT, LEGACY)
+
+# ====== Sources ======
+# Records are (cursor, namespace, vector_id, text, metadata); cursors increase within a source
+
+def iter_profiles(db_path: str, after: int = 0):
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(
+            "SELECT rowid, username, gender, age, medical_history FROM users WHERE rowid > ? ORDER BY rowid", (after,)
+        )
+        for rows in iter(lambda: cursor.fetchmany(REEMBED_BATCH_SIZE), []):
+            for rowid, username, gender, age, medical_history in rows:
+                if gender is None and age is None and medical_history is None:
+                    continue  # Profile never saved, so there is no vector to rebuild
+                text = profile_text(gender, age, medical_history)
+                yield rowid, username, profile_vector_id(username), text, {"text": text}
+    finally:
+        conn.close()
+
+def iter_chat(after: int = 0):
+    for seq, turn_id, username, role, content in chat_log.scan(after, REEMBED_BATCH_SIZE):
+        yield seq, username, chat_vector_id(username, role, turn_id), content, {"text": content, "turn_id": turn_id, "role": role}
+
+def iter_legacy(store, after: str = ""):
+    """
+    Vectors of the source store that neither the users database nor the chat log can rebuild:
+    everything except profiles and chat vectors carrying a turn_id. The cursor is the namespace,
+    so a resumed run repeats at most the namespace it stopped in.
+    """
+    namespaces = sorted(ns for ns in store.describe_index_stats()["namespaces"] if ns >= after)
+    for namespace in namespaces:
+        for page in store.iter_vectors(namespace, REEMBED_UPSERT_BATCH):
+            for vector_id, metadata in page:
+                if vector_id.startswith(PROFILE_PREFIX) or "turn_id" in metadata:
+                    continue
+                if not metadata.get("text"):
+                    logging.warning(f"Skipping {vector_id} in {namespace}: no text in its metadata")
+                    continue
+                yield namespace, namespace, vector_id, metadata["text"], metadata
+
+def _batched(records, size: int):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ====== Encode Workers ======
+_model = None
+
+def _init_worker(model_name: str, backend: str, threads: int):
+    """
+    Load the model once per worker, with intra-op threads split between workers to avoid oversubscription
+    """
+    global _model
+    _model = load_embedding_model(model_name, backend, threads)
+
+def _encode(texts):
+    return _model.encode(texts, batch_size=MODEL_BATCH_SIZE, convert_to_numpy=True).astype(np.float32, copy=False)
+
+# ====== Job ======
+class ReembedJob:
+    """
+    Ordered encode/upsert pipeline: up to two encode jobs per worker are in flight while the
+    oldest finished batch is upserted, so the checkpoint only ever moves past fully written rows.
+    """
+    def __init__(self, target, target_name: str, model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND,
+                 workers: int = REEMBED_WORKERS,
+                 batch_size: int = REEMBED_BATCH_SIZE, upsert_batch: int = REEMBED_UPSERT_BATCH,
+                 upsert_workers: int = REEMBED_UPSERT_WORKERS, checkpoint_path: str = REEMBED_CHECKPOINT,
+                 users_db: str = USERS_DB_PATH, source=None):
+        self.target = target
+        self.source = source
+        self.target_name = target_name
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = workers
+        self.batch_size = batch_size
+        self.upsert_batch = upsert_batch
+        self.upsert_workers = upsert_workers
+        self.checkpoint_path = checkpoint_path
+        self.users_db = users_db
+
+    def load_checkpoint(self, restart: bool = False):
+        state = {"model": self.model_name, "backend": self.backend, "target": self.target_name, PROFILES: 0, CHAT: 0, LEGACY: ""}
+        if restart or not os.path.exists(self.checkpoint_path):
+            return state
+        with open(self.checkpoint_path) as f:
+            saved = json.load(f)
+        identity = (self.model_name, self.backend, self.target_name)
+        if (saved.get("model"), saved.get("backend", self.backend), saved.get("target")) != identity:
+            raise SystemExit(
+                f"{self.checkpoint_path} belongs to a run with model {saved.get('model')} ({saved.get('backend')}) "
+                f"into {saved.get('target')}, "
+                "use --restart or another --checkpoint"
+            )
+        state.update(saved)
+        return state
+
+    def save_checkpoint(self, state):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def run(self, sources=SOURCES, restart: bool = False):
+        """
+        Re-embed the given sources, returns {source: (vectors, seconds)}
+        """
+        if LEGACY in sources and self.source is None:
+            raise ValueError("The legacy source needs a source vector store")
+        state = self.load_checkpoint(restart)
+        if self.workers > 0:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            encoder = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.model_name, self.backend, threads))
+        else:
+            encoder = ThreadPoolExecutor(1, initializer=_init_worker, initargs=(self.model_name, self.backend, os.cpu_count() or 1))
+        results = {}
+        with encoder, ThreadPoolExecutor(self.upsert_workers) as upserter:
+            for source in sources:
+                if source == PROFILES:
+                    records = iter_profiles(self.users_db, state[source])
+                elif source == CHAT:
+                    records = iter_chat(state[source])
+                else:
+                    records = iter_legacy(self.source, state[source])
+                results[source] = self._run_source(source, records, state, encoder, upserter)
+        return results
+
+    def _run_source(self, source, records, state, encoder, upserter):
+        in_flight = deque()
+        max_in_flight = max(1, self.workers) * 2
+        written = 0
+        start = time.perf_counter()
+        for batch in _batched(records, self.batch_size):
+            in_flight.append((batch, encoder.submit(_encode, [record[3] for record in batch])))
+            if len(in_flight) >= max_in_flight:
+                written += self._write(source, *in_flight.popleft(), state, upserter)
+                self._report(source, written, start)
+        while in_flight:
+            written += self._write(source, *in_flight.popleft(), state, upserter)
+            self._report(source, written, start)
+        elapsed = time.perf_counter() - start
+        print(f"\r{source}: {written} vectors in {elapsed:.1f}s ({written / max(elapsed, 1e-9):.0f} vectors/s)")
+        return written, elapsed
+
+    def _write(self, source, batch, encoded, state, upserter):
+        vectors = encoded.result()
+        by_namespace = defaultdict(list)
+        for (_, namespace, vector_id, _, metadata), vector in zip(batch, vectors):
+            by_namespace[namespace].append((vector_id, vector.tolist(), metadata))
+        requests = [
+            upserter.submit(self.target.upsert, items[i:i + self.upsert_batch], namespace)
+            for namespace, items in by_namespace.items()
+            for i in range(0, len(items), self.upsert_batch)
+        ]
+        for request in requests:
+            request.result()  # A failed upsert stops the job before the checkpoint moves past it
+        state[source] = batch[-1][0]
+        self.save_checkpoint(state)
+        return len(batch)
+
+    @staticmethod
+    def _report(source, written, start):
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(f"\r{source}: {written} vectors ({written / elapsed:.0f}/s)", end="", flush=True)
+
+def open_store(backend: str, index_name: str, path: str, dimension: int, create_if_missing: bool = True):
+    """
+    Vector store and the name recorded in the checkpoint
+    """
+    if backend == "local":
+        return LocalVectorStore(path, dimension), f"local:{os.path.abspath(path)}"
+    host = PINECONE_INDEX_HOST if index_name == INDEX_NAME else None
+    store = PineconeVectorStore(index_name=index_name, host=host, dimension=dimension, create_if_missing=create_if_missing)
+    return store, f"pinecone:{index_name}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="Model to embed with (the torch backend loads it by name)")
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND, help="Default EMBEDDING_BACKEND")
+    parser.add_argument("--dimension", type=int, default=EMBEDDING_DIMENSION, help="Vector size of --model")
+    parser.add_argument("--target-backend", choices=("pinecone", "local"), default=VECTOR_STORE_BACKEND)
+    parser.add_argument("--target-index", default=INDEX_NAME, help="Pinecone index, created if missing")
+    parser.add_argument("--target-path", default=VECTOR_STORE_PATH, help="Local vector store directory")
+    parser.add_argument("--source-backend", choices=("pinecone", "local"), default=VECTOR_STORE_BACKEND, help="Store read by the legacy source")
+    parser.add_argument("--source-index", default=INDEX_NAME)
+    parser.add_argument("--source-path", default=VECTOR_STORE_PATH)
+    parser.add_argument("--source-dimension", type=int, default=EMBEDDING_DIMENSION, help="Vector size of the source store")
+    parser.add_argument("--sources", default=",".join(SOURCES), help="Comma-separated: profiles, chat, legacy")
+    parser.add_argument("--workers", type=int, default=REEMBED_WORKERS, help="Encode processes, 0 to encode in this process")
+    parser.add_argument("--batch-size", type=int, default=REEMBED_BATCH_SIZE)
+    parser.add_argument("--checkpoint", default=REEMBED_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the beginning")
+    parser.add_argument("--users-db", default=USERS_DB_PATH)
+    args = parser.parse_args()
+
+    sources = [s.strip() for s in args.sources.split(",") if s.strip()]
+    unknown = set(sources) - set(SOURCES)
+    if unknown:
+        parser.error(f"unknown sources: {', '.join(sorted(unknown))}")
+    target, target_name = open_store(args.target_backend, args.target_index, args.target_path, args.dimension)
+    source = None
+    if LEGACY in sources:
+        source, _ = open_store(args.source_backend, args.source_index, args.source_path, args.source_dimension,
+                               create_if_missing=False)
+    job = ReembedJob(target, target_name, model_name=args.model, backend=args.backend, workers=args.workers,
+                     batch_size=args.batch_size, checkpoint_path=args.checkpoint, users_db=args.users_db, source=source)
+    start = time.perf_counter()
+    results = job.run(sources, restart=args.restart)
+    total = sum(written for written, _ in results.values())
+    elapsed = time.perf_counter() - start
+    print(f"Re-embedded {total} vectors into {target_name} in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} vectors/s)")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
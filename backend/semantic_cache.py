@@ -0,0 +1,94 @@
+import os
+import time
+import numpy as np
+from backend.embeddings import EMBEDDING_DIMENSION
+
+# ====== Semantic Cache Configuration ======
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # Minimum cosine similarity for a hit
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))  # Seconds
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+
+class SemanticCache:
+    """
+    Answer cache for general (not user-specific) questions, looked up by prompt embedding.
+
+    Entries live in a preallocated flat float32 matrix of normalised vectors, so a lookup is one
+    matrix-vector product. When full, expired entries are reused first, then the least recently used.
+    """
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, dimension: int = EMBEDDING_DIMENSION,
+                 enabled: bool = SEMANTIC_CACHE_ENABLED):
+        self.enabled = enabled and max_entries > 0
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries if self.enabled else 0
+        self.size = 0
+        max_entries = self.max_entries
+        self.vectors = np.zeros((max_entries, dimension), dtype=np.float32)
+        self.expires_at = np.zeros(max_entries, dtype=np.float64)
+        self.last_used = np.zeros(max_entries, dtype=np.float64)
+        self.prompts = [None] * max_entries
+        self.answers = [None] * max_entries
+        self.counters = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def _normalise(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, vector):
+        """
+        Return (answer, similarity) of the closest live entry above the threshold, or None
+        """
+        self.counters["lookups"] += 1
+        if self.size == 0:
+            self.counters["misses"] += 1
+            return None
+        now = time.time()
+        scores = self.vectors[:self.size] @ self._normalise(vector)
+        scores[self.expires_at[:self.size] < now] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        self.last_used[best] = now
+        return self.answers[best], float(scores[best])
+
+    def _free_slot(self, now: float) -> int:
+        if self.size < self.max_entries:
+            self.size += 1
+            return self.size - 1
+        expired = np.flatnonzero(self.expires_at < now)
+        if expired.size:
+            self.counters["expired"] += 1
+            return int(expired[0])
+        self.counters["evictions"] += 1
+        return int(np.argmin(self.last_used))
+
+    def store(self, vector, prompt: str, answer: str):
+        if not answer:
+            return
+        now = time.time()
+        slot = self._free_slot(now)
+        self.vectors[slot] = self._normalise(vector)
+        self.expires_at[slot] = now + self.ttl
+        self.last_used[slot] = now
+        self.prompts[slot] = prompt
+        self.answers[slot] = answer
+        self.counters["stores"] += 1
+
+    def stats(self):
+        lookups = self.counters["lookups"]
+        return {
+            **self.counters,
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            "entries": self.size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "enabled": self.enabled,
+        }
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,289 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+import httpx
+from backend.metrics import Counter
+
+# ====== Upstream Call Policy ======
+# Every upstream call goes through Upstream.call, which applies the request deadline, retries
+# idempotent calls with jittered exponential backoff, trips a per-upstream circuit breaker after
+# consecutive failures and, optionally, hedges slow idempotent calls with a second attempt.
+UPSTREAM_RETRY_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "3"))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.1"))  # Seconds, doubled per attempt
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "2.0"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # Consecutive failures that open the breaker
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))  # Seconds open before one probe call is let through
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))  # Hedge once an attempt is slower than this latency quantile
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # Latency samples needed before hedging starts
+
+UPSTREAM_CALLS = Counter("upstream_calls_total", "Upstream call attempts by outcome", ("upstream", "outcome"))
+
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+class UpstreamError(Exception):
+    """
+    Raised when an upstream call fails after the retry policy is exhausted
+    """
+
+class CircuitOpenError(UpstreamError):
+    """
+    Raised without calling the upstream while its circuit breaker is open
+    """
+
+class DeadlineExceeded(UpstreamError):
+    """
+    Raised when the request deadline leaves no time for another attempt
+    """
+
+class RetryableStatus(Exception):
+    """
+    Raised by call operations for responses worth retrying (429 and 5xx)
+    """
+    def __init__(self, status_code: int, detail: str = ""):
+        super().__init__(f"HTTP {status_code} {detail}".strip())
+        self.status_code = status_code
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+# ====== Deadlines ======
+@contextmanager
+def deadline(seconds: float):
+    """
+    Bound every upstream call made inside the block (including nested tasks) to finish within `seconds`
+    """
+    expires_at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires_at if current is None else min(current, expires_at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def detach_deadline():
+    """
+    Drop the inherited deadline in a task that serves more than the request that started it
+    """
+    _deadline.set(None)
+
+def remaining_time():
+    """
+    Seconds left before the current deadline, or None without a deadline
+    """
+    expires_at = _deadline.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+def time_budget(timeout: float) -> float:
+    """
+    `timeout` capped by the current deadline; raises DeadlineExceeded once it has passed
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(timeout, remaining)
+
+# ====== Circuit Breaker ======
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, rejects calls for `reset_timeout`
+    seconds, then lets a single probe through (half-open) and closes again if it succeeds
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opens += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """
+        End a probe without judging the upstream (e.g. the caller was cancelled)
+        """
+        self._probe_in_flight = False
+
+# ====== Upstream ======
+class Upstream:
+    """
+    Call policy for one upstream service. Operations are `async def op(timeout)` callables that
+    return a result or raise: httpx transport errors and RetryableStatus count as upstream failures,
+    any other exception is passed through without touching the breaker.
+    """
+    def __init__(self, name: str, attempts: int = UPSTREAM_RETRY_ATTEMPTS, base_delay: float = UPSTREAM_RETRY_BASE_DELAY,
+                 max_delay: float = UPSTREAM_RETRY_MAX_DELAY, breaker: CircuitBreaker = None,
+                 hedge_quantile: float = HEDGE_QUANTILE, hedge_min_samples: int = HEDGE_MIN_SAMPLES):
+        self.name = name
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "rejected": 0, "failures": 0}
+        self._latencies = deque(maxlen=500)
+
+    def hedge_delay(self):
+        if len(self._latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))]
+
+    async def _attempt(self, op, timeout: float):
+        start = time.monotonic()
+        result = await asyncio.wait_for(op(timeout), timeout=timeout)
+        self._latencies.append(time.monotonic() - start)
+        return result
+
+    async def _hedged_attempt(self, op, timeout: float):
+        """
+        Start a second attempt if the first is slower than the hedge quantile; the first to succeed wins
+        """
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return await self._attempt(op, timeout)
+        first = asyncio.ensure_future(self._attempt(op, timeout))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+            self.counters["hedges"] += 1
+            UPSTREAM_CALLS.inc(self.name, "hedge")
+            tasks.append(asyncio.ensure_future(self._attempt(op, max(timeout - delay, 0.001))))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self, op, timeout: float, idempotent: bool = False, hedge: bool = False):
+        """
+        Run `op` under the deadline, retry and breaker policy. Non-idempotent calls are only
+        retried when the connection could not be established (the request was never sent).
+        """
+        if not self.breaker.allow():
+            self.counters["rejected"] += 1
+            UPSTREAM_CALLS.inc(self.name, "rejected")
+            raise CircuitOpenError(f"{self.name} circuit breaker is open")
+        self.counters["calls"] += 1
+        error = None  # Last upstream failure
+        try:
+            for attempt in range(self.attempts):
+                if attempt:
+                    backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                    remaining = remaining_time()
+                    if remaining is not None and remaining <= backoff:
+                        break
+                    self.counters["retries"] += 1
+                    await asyncio.sleep(backoff)
+                try:
+                    budget = time_budget(timeout)
+                    if hedge and idempotent:
+                        result = await self._hedged_attempt(op, budget)
+                    else:
+                        result = await self._attempt(op, budget)
+                except (httpx.TransportError, RetryableStatus, asyncio.TimeoutError) as e:
+                    timed_out = isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException))
+                    remaining = remaining_time()
+                    if timed_out and remaining is not None and remaining <= 0 and error is None:
+                        # Cut short by the request deadline rather than by the upstream's own timeout
+                        self.breaker.release()
+                        raise DeadlineExceeded("Request deadline exceeded") from e
+                    error = e
+                    UPSTREAM_CALLS.inc(self.name, "error")
+                    retry_safe = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                    if not retry_safe:
+                        break
+                    continue
+                except DeadlineExceeded:
+                    if error is None:
+                        # Out of time before the upstream was tried, not a sign that it is failing
+                        self.breaker.release()
+                        raise
+                    break
+                self.breaker.record_success()
+                UPSTREAM_CALLS.inc(self.name, "success")
+                return result
+        except DeadlineExceeded:
+            raise
+        except BaseException:
+            # Cancelled or a non-upstream error: the upstream itself was not shown to be failing
+            self.breaker.release()
+            raise
+
+        self.counters["failures"] += 1
+        self.breaker.record_failure()
+        if self.breaker.state == CircuitBreaker.OPEN:
+            logging.warning(f"{self.name} circuit breaker open after {self.breaker.failures} consecutive failures")
+        if error is None:
+            raise DeadlineExceeded("Request deadline exceeded")
+        if isinstance(error, asyncio.TimeoutError):
+            raise UpstreamError(f"{self.name} timed out") from error
+        raise UpstreamError(f"{self.name} call failed: {error}") from error
+
+    def stats(self):
+        delay = self.hedge_delay()
+        return {
+            **self.counters,
+            "breaker_open": self.breaker.state == CircuitBreaker.OPEN,
+            "breaker_opens": self.breaker.opens,
+            "consecutive_failures": self.breaker.failures,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else 0,
+        }
+
+_upstreams = {}
+
+def get_upstream(name: str) -> Upstream:
+    """
+    Shared call policy (and breaker state) for the named upstream, see backend.http_clients for the names
+    """
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        upstream = _upstreams[name] = Upstream(name)
+    return upstream
@@ -0,0 +1,19 @@
+# ====== Vector Ids ======
+# Ids and texts of stored vectors, shared by the request path and the offline re-embedding job so
+# every vector can be rebuilt from its source row
+PROFILE_PREFIX = "profile-"
+
+def profile_vector_id(username: str) -> str:
+    return f"{PROFILE_PREFIX}{username}"
+
+def profile_text(gender, age, medical_history) -> str:
+    """
+    Text embedded for a user's profile (written by PUT /api/user/{username})
+    """
+    return f"My gender is {gender}, my age is {age}, and I have a medical history of {medical_history}."
+
+def chat_vector_id(username: str, role: str, turn_id: str) -> str:
+    """
+    Vector store id of a logged chat message (role is "user" or "model")
+    """
+    return f"{role}-{username}-{turn_id}"
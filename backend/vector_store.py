@@ -0,0 +1,423 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+import numpy as np
+from dotenv import load_dotenv
+from backend.embeddings import EMBEDDING_DIMENSION
+
+try:
+    import fcntl
+except ImportError:  # Windows: the local store is then only safe for a single process
+    fcntl = None
+
+load_dotenv()
+
+# ====== Vector Store Configuration ======
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")  # "pinecone" or "local"
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./vector_store")  # Used by the local backend
+LOCK_FILE = "%00lock"  # A file, never read as a namespace directory (usernames cannot contain NUL)
+VECTOR_STORE_COMPACT_MIN_ENTRIES = int(os.getenv("VECTOR_STORE_COMPACT_MIN_ENTRIES", "1000"))  # Local backend metadata log
+
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST")  # Optional data-plane host, skips index discovery (e.g. a local stand-in)
+INDEX_NAME = "healthassistant"
+
+class VectorStore:
+    """
+    Namespaced vector store interface. Vectors are (id, values, metadata) tuples and query results
+    are {"matches": [{"id", "score", "metadata"}]} dicts, whichever backend is used.
+    """
+    def upsert(self, vectors, namespace: str):
+        raise NotImplementedError
+
+    def query(self, vector, top_k: int, namespace: str, include_metadata: bool = True):
+        raise NotImplementedError
+
+    def delete(self, ids, namespace: str):
+        raise NotImplementedError
+
+    def delete_namespace(self, namespace: str):
+        raise NotImplementedError
+
+    def describe_index_stats(self):
+        """
+        Return {"dimension": int, "namespaces": {namespace: {"vector_count": int}}}
+        """
+        raise NotImplementedError
+
+    def iter_vectors(self, namespace: str, batch_size: int = 100):
+        """
+        Yield pages of (id, metadata) for every vector in the namespace (values are not returned)
+        """
+        raise NotImplementedError
+
+class PineconeVectorStore(VectorStore):
+    """
+    Pinecone serverless index, one namespace per user
+    """
+    def __init__(self, index_name: str = INDEX_NAME, api_key: str = PINECONE_API_KEY, create_if_missing: bool = True,
+                 host: str = PINECONE_INDEX_HOST, dimension: int = EMBEDDING_DIMENSION):
+        from pinecone import Pinecone
+
+        pc = Pinecone(api_key=api_key, environment="us-east-1-aws")
+        if host:
+            self.index = pc.Index(index_name, host=host)
+            return
+        if create_if_missing:
+            existing_indexes = [index["name"] for index in pc.list_indexes()]
+            if index_name not in existing_indexes:
+                pc.create_index(name=index_name, dimension=dimension, metric="cosine")
+        self.index = pc.Index(index_name)
+
+    def upsert(self, vectors, namespace: str):
+        self.index.upsert(vectors, namespace=namespace)
+
+    def query(self, vector, top_k: int, namespace: str, include_metadata: bool = True):
+        results = self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata, namespace=namespace)
+        matches = [{"id": m["id"], "score": m["score"], "metadata": m.get("metadata") or {}} for m in results.get("matches", [])]
+        return {"matches": matches}
+
+    def delete(self, ids, namespace: str):
+        self.index.delete(ids=ids, namespace=namespace)
+
+    def delete_namespace(self, namespace: str):
+        self.index.delete(delete_all=True, namespace=namespace)
+
+    def describe_index_stats(self):
+        stats = self.index.describe_index_stats()
+        namespaces = stats.get("namespaces") or {}
+        return {
+            "dimension": stats.get("dimension"),
+            "namespaces": {ns: {"vector_count": summary["vector_count"]} for ns, summary in namespaces.items()},
+        }
+
+    def iter_vectors(self, namespace: str, batch_size: int = 100):
+        # list() pages through ids (serverless indexes only), fetch() returns their metadata
+        for ids in self.index.list(namespace=namespace, limit=batch_size):
+            vectors = self.index.fetch(ids=list(ids), namespace=namespace).vectors
+            yield [(vector_id, vectors[vector_id].metadata or {}) for vector_id in ids if vector_id in vectors]
+
+class _LocalNamespace:
+    """
+    One namespace of the local store: L2-normalised float32 rows in a memory-mapped file plus ids/metadata.
+
+    Ids and metadata are a records.json snapshot plus an append-only log of upserts and deletes
+    since it, so a write costs the size of the change. The log is folded into a new snapshot once it
+    has more entries than the namespace has vectors (and at least VECTOR_STORE_COMPACT_MIN_ENTRIES).
+    Each snapshot starts a new log generation, so a crash mid-compaction never replays a log twice.
+    Callers hold the store lock; sync() catches up with what other processes wrote since.
+    """
+    INITIAL_ROWS = 64
+
+    def __init__(self, directory: str, dim: int, exclusive: bool = False):
+        self.directory = directory
+        self.dim = dim
+        self.matrix = None
+        self._log = None
+        self._records_path = os.path.join(directory, "records.json")
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._load(exclusive)
+
+    def _files(self):
+        # os.replace and re-creation give new inodes, so this changes when another process compacts or deletes
+        return tuple(os.stat(path).st_ino if os.path.exists(path) else None for path in (self._records_path, self._vectors_path))
+
+    def _load(self, exclusive: bool):
+        self.close()
+        self.ids = []
+        self.metadata = []
+        self.rows = {}
+        self.matrix = None
+        self.generation = 0
+        self._log_offset = 0
+        self._log_entries = 0
+        if os.path.exists(self._records_path):
+            with open(self._records_path) as f:
+                records = json.load(f)
+            self.ids = records["ids"]
+            self.metadata = records["metadata"]
+            self.generation = records.get("generation", 0)
+            self.rows = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        self._replay(exclusive)
+        self._map(max(len(self.ids), 1))
+        self._signature = self._files()
+
+    def sync(self, exclusive: bool = False):
+        """
+        Apply log entries and snapshots written by other processes since the last sync
+        """
+        if self._files() != self._signature:
+            self._load(exclusive)
+            return
+        path = self._log_path(self.generation)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < self._log_offset:
+            self._load(exclusive)
+        elif size > self._log_offset:
+            self._replay(exclusive)
+            self._map(max(len(self.ids), 1))
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"records-{generation}.log")
+
+    def _replay(self, exclusive: bool):
+        path = self._log_path(self.generation)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            f.seek(self._log_offset)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                if entry[0] == "u":
+                    self._set(entry[1], entry[2])
+                else:
+                    self._remove(entry[1])
+                self._log_entries += 1
+                self._log_offset += len(line)
+        if exclusive and self._log_offset < os.path.getsize(path):
+            # Torn last entry from a crashed writer (never acknowledged), cut it so new entries start on a fresh line
+            with open(path, "r+b") as f:
+                f.truncate(self._log_offset)
+
+    def _map(self, min_rows: int):
+        rows = self.INITIAL_ROWS
+        while rows < min_rows:
+            rows *= 2
+        if self.matrix is not None and self.matrix.shape[0] >= rows:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        size = rows * self.dim * 4
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        if self.matrix is not None:
+            self.matrix.flush()
+        self.matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    def _set(self, vector_id: str, metadata) -> int:
+        row = self.rows.get(vector_id)
+        if row is None:
+            row = len(self.ids)
+            self.ids.append(vector_id)
+            self.metadata.append({})
+            self.rows[vector_id] = row
+        self.metadata[row] = metadata
+        return row
+
+    def _remove(self, vector_id: str):
+        """
+        Drop the id, moving the last row into the hole so live rows stay contiguous. Returns (hole, last) or None
+        """
+        row = self.rows.pop(vector_id, None)
+        if row is None:
+            return None
+        last = len(self.ids) - 1
+        if row != last:
+            self.ids[row] = self.ids[last]
+            self.metadata[row] = self.metadata[last]
+            self.rows[self.ids[row]] = row
+        self.ids.pop()
+        self.metadata.pop()
+        return row, last
+
+    def _append_log(self, entries):
+        # Vectors reach the file before the log entries that make them visible
+        self.matrix.flush()
+        if self._log is None:
+            self._log = open(self._log_path(self.generation), "ab")
+        data = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+        self._log.write(data)
+        self._log.flush()
+        self._log_offset += len(data)
+        self._log_entries += len(entries)
+        if self._log_entries > max(VECTOR_STORE_COMPACT_MIN_ENTRIES, len(self.ids)):
+            self.compact()
+
+    def compact(self):
+        """
+        Write a snapshot of ids/metadata as the next generation and drop the log it replaces
+        """
+        old_log = self._log_path(self.generation)
+        tmp_path = self._records_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "generation": self.generation + 1, "ids": self.ids, "metadata": self.metadata}, f)
+        self.matrix.flush()
+        os.replace(tmp_path, self._records_path)
+        self.close()
+        self.generation += 1
+        self._log_offset = 0
+        self._log_entries = 0
+        if os.path.exists(old_log):
+            os.remove(old_log)
+        self._signature = self._files()
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def upsert(self, vectors):
+        entries = []
+        for vector_id, values, *rest in vectors:
+            values = np.asarray(values, dtype=np.float32)
+            norm = np.linalg.norm(values)
+            metadata = rest[0] if rest else {}
+            row = self._set(vector_id, metadata)
+            self._map(row + 1)
+            self.matrix[row] = values / norm if norm > 0 else values
+            entries.append(["u", vector_id, metadata])
+        if entries:
+            self._append_log(entries)
+
+    def query(self, vector, top_k: int, include_metadata: bool):
+        count = len(self.ids)
+        if count == 0 or top_k <= 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        scores = self.matrix[:count] @ query
+        if top_k < count:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"id": self.ids[row], "score": float(scores[row]), "metadata": self.metadata[row] if include_metadata else {}}
+            for row in top
+        ]
+
+    def delete(self, ids):
+        entries = []
+        for vector_id in ids:
+            moved = self._remove(vector_id)
+            if moved is None:
+                continue
+            row, last = moved
+            if row != last:
+                self.matrix[row] = self.matrix[last]
+            entries.append(["d", vector_id])
+        if entries:
+            self._append_log(entries)
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store with exact cosine top-k over memory-mapped per-namespace matrices.
+
+    Several processes can open the same directory (uvicorn workers, CLI_DB_Manager.py, backend.reembed):
+    writes hold an exclusive flock on the store's lock file and reads a shared one, and every
+    operation first catches up with the namespace's log.
+    """
+    def __init__(self, path: str = VECTOR_STORE_PATH, dimension: int = EMBEDDING_DIMENSION):
+        self.path = path
+        self.dimension = dimension
+        self._namespaces = {}
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, LOCK_FILE), "a")
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _directory(self, namespace: str) -> str:
+        return os.path.join(self.path, quote(namespace, safe="") or "%00default")
+
+    def _namespace(self, namespace: str, create: bool = False, exclusive: bool = False):
+        directory = self._directory(namespace)
+        ns = self._namespaces.get(namespace)
+        if ns is not None and not os.path.isdir(directory):
+            # Deleted by another process
+            ns.close()
+            del self._namespaces[namespace]
+            ns = None
+        if ns is None:
+            if not create and not os.path.isdir(directory):
+                return None
+            ns = _LocalNamespace(directory, self.dimension, exclusive)
+            self._namespaces[namespace] = ns
+        else:
+            ns.sync(exclusive)
+        return ns
+
+    def upsert(self, vectors, namespace: str):
+        with self._locked(exclusive=True):
+            self._namespace(namespace, create=True, exclusive=True).upsert(vectors)
+
+    def query(self, vector, top_k: int, namespace: str, include_metadata: bool = True):
+        with self._locked():
+            ns = self._namespace(namespace)
+            return {"matches": ns.query(vector, top_k, include_metadata) if ns is not None else []}
+
+    def delete(self, ids, namespace: str):
+        with self._locked(exclusive=True):
+            ns = self._namespace(namespace, exclusive=True)
+            if ns is not None:
+                ns.delete(ids)
+
+    def delete_namespace(self, namespace: str):
+        with self._locked(exclusive=True):
+            ns = self._namespaces.pop(namespace, None)
+            if ns is not None:
+                ns.close()
+                if ns.matrix is not None:
+                    ns.matrix.flush()
+                    ns.matrix = None
+            directory = self._directory(namespace)
+            if os.path.exists(directory):
+                for name in os.listdir(directory):
+                    os.remove(os.path.join(directory, name))
+                os.rmdir(directory)
+
+    def describe_index_stats(self):
+        with self._locked():
+            namespaces = {}
+            for name in sorted(os.listdir(self.path)):
+                if not os.path.isdir(os.path.join(self.path, name)):
+                    continue
+                namespace = "" if name == "%00default" else unquote(name)
+                ns = self._namespace(namespace)
+                if ns is not None and ns.ids:
+                    namespaces[namespace] = {"vector_count": len(ns.ids)}
+            return {"dimension": self.dimension, "namespaces": namespaces}
+
+    def iter_vectors(self, namespace: str, batch_size: int = 100):
+        with self._locked():
+            ns = self._namespace(namespace)
+            records = list(zip(ns.ids, ns.metadata)) if ns is not None else []
+        for start in range(0, len(records), batch_size):
+            yield records[start:start + batch_size]
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+def get_vector_store() -> VectorStore:
+    """
+    Process-wide vector store selected by VECTOR_STORE_BACKEND
+    """
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None:
+                if VECTOR_STORE_BACKEND == "local":
+                    _vector_store = LocalVectorStore()
+                elif VECTOR_STORE_BACKEND == "pinecone":
+                    _vector_store = PineconeVectorStore()
+                else:
+                    raise ValueError(f"Unknown VECTOR_STORE_BACKEND: {VECTOR_STORE_BACKEND}")
+    return _vector_store
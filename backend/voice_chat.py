@@ -1,36 +1,207 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import asyncio
 import base64
-import requests
+import io
+import httpx
 import os
 import logging
-
-import os
+import re
+import tempfile
+import time
+import uuid
+import wave
 from dotenv import load_dotenv
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import MultipartParseError
+from backend.http_clients import get_client, ZHIPU
+from backend.upstream import get_upstream, is_retryable_status, RetryableStatus, UpstreamError, CircuitOpenError, DeadlineExceeded
 
-load_dotenv() 
+load_dotenv()
 
 router = APIRouter(prefix="/api/voice_chat", tags=["Voice Chat"])  # Using prefix and tags
 
-API_URL = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+API_URL = os.getenv("ZHIPU_API_URL", "https://open.bigmodel.cn/api/paas/v4/chat/completions")
 VOICE_API_KEY = os.getenv("ZHIPU_API_KEY")
 
+# ====== Upload Limits ======
+VOICE_MAX_UPLOAD_BYTES = int(os.getenv("VOICE_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+VOICE_MAX_DURATION_SECONDS = float(os.getenv("VOICE_MAX_DURATION_SECONDS", "60"))
+VOICE_MULTIPART_OVERHEAD_BYTES = 16 * 1024  # Boundaries and part headers allowed on top of the audio
+VOICE_TIMEOUT = float(os.getenv("VOICE_TIMEOUT", "15"))
+
+# ====== Reply Audio Store ======
+# Reply audio is written to a directory shared by every worker process for a short time and
+# streamed from /audio/{audio_id}, so the follow-up GET may land on any worker
+VOICE_AUDIO_DIR = os.getenv("VOICE_AUDIO_DIR", os.path.join(tempfile.gettempdir(), "llm-health-voice-audio"))
+VOICE_AUDIO_TTL = float(os.getenv("VOICE_AUDIO_TTL", "300"))
+VOICE_AUDIO_STORE_BYTES = int(os.getenv("VOICE_AUDIO_STORE_BYTES", str(64 * 1024 * 1024)))
+VOICE_STREAM_CHUNK_BYTES = 32 * 1024
+
 logging.basicConfig(level=logging.INFO)
 
-def encode_audio_to_base64(audio_file_path):
-    with open(audio_file_path, "rb") as audio_file:
-        return base64.b64encode(audio_file.read()).decode("utf-8")
+class ReplyAudioStore:
+    """
+    Short-lived, byte-bounded store of decoded reply audio, one file per clip. Expiry is by file
+    mtime, so any worker sharing the directory can serve and clean up any clip.
+    """
+    SUFFIX = ".wav"
 
-@router.post("/")
-async def voice_chat(file: UploadFile = File(...)):
+    def __init__(self, directory: str = VOICE_AUDIO_DIR, ttl: float = VOICE_AUDIO_TTL, max_bytes: int = VOICE_AUDIO_STORE_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _path(self, audio_id: str) -> str:
+        return os.path.join(self.directory, audio_id + self.SUFFIX)
+
+    def _expire(self, now: float):
+        clips = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.SUFFIX):
+                continue  # Clips still being written
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Removed by another worker
+            clips.append((stat.st_mtime, stat.st_size, entry.path))
+        clips.sort()
+        total = sum(size for _, size, _ in clips)
+        for mtime, size, path in clips:
+            if mtime + self.ttl >= now and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def put(self, audio: bytes) -> str:
+        """
+        Store a clip and return its id (blocking file I/O, call from a worker thread)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        audio_id = uuid.uuid4().hex
+        tmp_path = self._path(audio_id) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, self._path(audio_id))
+        self._expire(time.time())
+        return audio_id
+
+    def open(self, audio_id: str):
+        """
+        Open a stored clip for reading, or None if the id is unknown or expired
+        """
+        if not re.fullmatch(r"[0-9a-f]{32}", audio_id):
+            return None
+        try:
+            f = open(self._path(audio_id), "rb")
+        except FileNotFoundError:
+            return None
+        if os.fstat(f.fileno()).st_mtime + self.ttl < time.time():
+            f.close()
+            return None
+        return f
+
+reply_audio_store = ReplyAudioStore()
+
+async def read_upload_limited(request: Request, field: str = "file", max_bytes: int = VOICE_MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Stream the multipart body and keep only the `field` part in a bounded in-memory buffer.
+    The limit is checked against Content-Length and while reading, so oversized uploads are
+    rejected before they are received and no part is spooled to a temp file.
+    """
+    too_large = HTTPException(status_code=413, detail=f"Audio exceeds the {max_bytes} byte limit")
+    body_limit = max_bytes + VOICE_MULTIPART_OVERHEAD_BYTES
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > body_limit:
+        raise too_large
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail=f"Expected a multipart/form-data upload with a '{field}' part")
+
+    field_name = field.encode()
+    buffer = bytearray()
+    part = {"header_field": b"", "header_value": b"", "name": None, "found": False, "overflow": False}
+
+    def on_part_begin():
+        part["name"] = None
+
+    def on_header_field(data, start, end):
+        part["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["header_value"] += data[start:end]
+
+    def on_header_end():
+        if part["header_field"].lower() == b"content-disposition":
+            part["name"] = parse_options_header(part["header_value"])[1].get(b"name")
+            part["found"] = part["found"] or part["name"] == field_name
+        part["header_field"] = part["header_value"] = b""
+
+    def on_part_data(data, start, end):
+        if part["name"] != field_name:
+            return
+        if len(buffer) + end - start > max_bytes:
+            part["overflow"] = True
+            return
+        buffer.extend(data[start:end])
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_part_data": on_part_data,
+    })
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise too_large
+            parser.write(chunk)
+            if part["overflow"]:
+                raise too_large
+        parser.finalize()
+    except MultipartParseError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed multipart upload: {e}")
+    if not part["found"]:
+        raise HTTPException(status_code=400, detail=f"Missing '{field}' part in the upload")
+    return bytes(buffer)
+
+def wav_duration_seconds(audio: bytes):
     """
-    Receive user audio files, call the large model interface, and return text and audio responses
+    Duration of a RIFF/WAV clip, or None if the header cannot be parsed (e.g. browser webm/ogg)
     """
-    audio_path = f"temp_{file.filename}"
+    if not audio.startswith(b"RIFF"):
+        return None
     try:
-        with open(audio_path, "wb") as buffer:
-            buffer.write(await file.read())
+        with wave.open(io.BytesIO(audio)) as clip:
+            return clip.getnframes() / float(clip.getframerate())
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return None
+
+def encode_audio_to_base64(audio: bytes) -> str:
+    return base64.b64encode(audio).decode("ascii")
+
+@router.post("/")
+async def voice_chat(request: Request):
+    """
+    Receive user audio files, call the large model interface, and return the text response
+    with a URL from which the audio response is streamed
+    """
+    # The multipart body is parsed here rather than by File(...), which would read it all first
+    audio = await read_upload_limited(request)
+    if not audio:
+        raise HTTPException(status_code=400, detail="Empty audio upload")
+    duration = wav_duration_seconds(audio)
+    if duration is not None and duration > VOICE_MAX_DURATION_SECONDS:
+        raise HTTPException(status_code=413, detail=f"Audio is {duration:.1f}s long, the limit is {VOICE_MAX_DURATION_SECONDS:.0f}s")
 
-        encoded_audio = encode_audio_to_base64(audio_path)
+    try:
+        # Encoding a large clip is CPU work, keep it off the event loop
+        encoded_audio = await asyncio.to_thread(encode_audio_to_base64, audio)
+        del audio
         payload = {
             "model": "glm-4-voice",
             "messages": [{"role": "user", "content": [{"type": "input_audio", "input_audio": {"data": encoded_audio, "format": "wav"}}]}],
@@ -38,15 +209,50 @@ async def voice_chat(file: UploadFile = File(...)):
         }
         headers = {"Content-Type": "application/json", "Authorization": f"Bearer {VOICE_API_KEY}"}
 
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=15)
-        os.remove(audio_path)
+        async def op(timeout):
+            response = await get_client(ZHIPU).post(API_URL, headers=headers, json=payload, timeout=timeout)
+            if is_retryable_status(response.status_code):
+                raise RetryableStatus(response.status_code, response.text[:200])
+            return response
 
-        if response.status_code == 200:
-            result = response.json()
-            text_response = result.get("choices", [{}])[0].get("message", {}).get("content", "No text response received.")
-            audio_data_base64 = result.get("choices", [{}])[0].get("message", {}).get("audio", {}).get("data", "")
-            return {"response": text_response, "audio": audio_data_base64}
-        else:
-            raise HTTPException(status_code=500, detail=f"API Error: {response.status_code}, {response.text}")
+        # Shares the Zhipu circuit breaker with health chat; not retried once the audio has been sent
+        response = await get_upstream(ZHIPU).call(op, VOICE_TIMEOUT)
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="The voice model is temporarily unavailable, please retry shortly.")
+    except UpstreamError as e:
+        if isinstance(e, DeadlineExceeded) or isinstance(e.__cause__, (asyncio.TimeoutError, httpx.TimeoutException)):
+            raise HTTPException(status_code=504, detail=f"API timed out after {VOICE_TIMEOUT}s")
+        raise HTTPException(status_code=502, detail=f"API Error: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+    if response.status_code == 200:
+        message = response.json().get("choices", [{}])[0].get("message", {})
+        text_response = message.get("content", "No text response received.")
+        audio_data_base64 = message.get("audio", {}).get("data", "")
+        audio_url = None
+        if audio_data_base64:
+            reply_audio = await asyncio.to_thread(base64.b64decode, audio_data_base64)
+            audio_id = await asyncio.to_thread(reply_audio_store.put, reply_audio)
+            audio_url = f"{router.prefix}/audio/{audio_id}"
+        return {"response": text_response, "audio_url": audio_url}
+    else:
+        raise HTTPException(status_code=500, detail=f"API Error: {response.status_code}, {response.text}")
+
+@router.get("/audio/{audio_id}")
+def voice_chat_audio(audio_id: str):
+    """
+    Stream a reply clip produced by voice_chat
+    """
+    f = reply_audio_store.open(audio_id)
+    if f is None:
+        raise HTTPException(status_code=404, detail="Audio not found or expired")
+    size = os.fstat(f.fileno()).st_size
+
+    def chunks():
+        # The open file stays readable even if another worker expires the clip meanwhile
+        with f:
+            for chunk in iter(lambda: f.read(VOICE_STREAM_CHUNK_BYTES), b""):
+                yield chunk
+
+    return StreamingResponse(chunks(), media_type="audio/wav", headers={"Content-Length": str(size)})
@@ -0,0 +1,106 @@
+"""
+Microbenchmark: linear keyword scans vs the compiled intent router
+
+    python -m benchmarks.bench_intent_router [--iterations N] [--extra-rules N]
+"""
+import argparse
+import json
+import os
+import random
+import string
+import tempfile
+import time
+from backend.intent_router import IntentRouter, INTENTS_CONFIG_PATH
+
+PROMPTS = [
+    "What are the symptoms of flu?",
+    "Can you show me a clinical trial about metformin and my age group?",
+    "Given my profile, is there any research on statins?",
+    "How much water should I drink per day when exercising in hot weather for more than an hour?",
+    "Please summarise the latest medical research and my history of migraines.",
+]
+
+def linear_route(text, keyword_sets):
+    lowered = text.lower()
+    return {intent for intent, keywords in keyword_sets.items() if any(k in lowered for k in keywords)}
+
+def random_keyword(rng):
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))) for _ in range(2))
+
+def build_config(extra_rules: int, seed: int = 0):
+    with open(INTENTS_CONFIG_PATH) as f:
+        config = json.load(f)
+    rng = random.Random(seed)
+    for i in range(extra_rules):
+        config["intents"][f"synthetic_{i}"] = {"keywords": [random_keyword(rng) for _ in range(10)]}
+    return config
+
+# Keywords that overlap, contain or prefix each other across intents
+OVERLAP_RULES = {
+    "case": ["case study"],
+    "pubmed": ["study", "history of medicine", "research"],
+    "pinecone": ["my history", "history"],
+    "prefix": ["stud", "med"],
+    "nested": ["medical research"],
+}
+OVERLAP_PROMPTS = [
+    "a case study",
+    "my history of medicine",
+    "studying medical research on my history",
+    "medicine",
+    "nothing relevant here",
+]
+
+def check_equivalence(router, keyword_sets, prompts):
+    for prompt in prompts:
+        expected = linear_route(prompt, keyword_sets)
+        assert router.match(prompt) == expected, (prompt, router.match(prompt), expected)
+
+def check_overlaps(samples: int = 2000, seed: int = 0):
+    """
+    Compiled router against the linear scan on overlapping keywords, hand-picked and random prompts
+    """
+    config = {"intents": {intent: {"keywords": keywords} for intent, keywords in OVERLAP_RULES.items()}}
+    keyword_sets = {intent: [k.lower() for k in keywords] for intent, keywords in OVERLAP_RULES.items()}
+    words = sorted({w for keywords in OVERLAP_RULES.values() for k in keywords for w in k.split()} | {"a", "of", "x"})
+    rng = random.Random(seed)
+    prompts = OVERLAP_PROMPTS + [" ".join(rng.choice(words) for _ in range(rng.randint(1, 6))) for _ in range(samples)]
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(config, f)
+    try:
+        check_equivalence(IntentRouter(f.name, reload_interval=0), keyword_sets, prompts)
+    finally:
+        os.remove(f.name)
+    print(f"Overlapping keywords: {len(prompts)} prompts match the linear scan")
+
+def timeit(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(PROMPTS[i % len(PROMPTS)])
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--extra-rules", type=int, nargs="*", default=[0, 10, 100])
+    args = parser.parse_args()
+
+    check_overlaps()
+    print(f"{'intents':>8} {'keywords':>9} {'linear (us)':>12} {'compiled (us)':>14} {'speedup':>8}")
+    for extra in args.extra_rules:
+        config = build_config(extra)
+        keyword_sets = {intent: [k.lower() for k in rule.get("keywords", [])] for intent, rule in config["intents"].items()}
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(config, f)
+        try:
+            router = IntentRouter(f.name, reload_interval=0)
+            check_equivalence(router, keyword_sets, PROMPTS + OVERLAP_PROMPTS)
+            linear = timeit(lambda text: linear_route(text, keyword_sets), args.iterations)
+            compiled = timeit(router.match, args.iterations)
+        finally:
+            os.remove(f.name)
+        keywords = sum(len(k) for k in keyword_sets.values())
+        print(f"{len(keyword_sets):>8} {keywords:>9} {linear:>12.2f} {compiled:>14.2f} {linear / compiled:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
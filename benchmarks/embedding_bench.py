@@ -0,0 +1,191 @@
+"""
+Embedding backend benchmark and accuracy check.
+
+Each backend runs in its own process, so import time and memory are those of one app worker.
+The process reports encodes/s in batches and one text at a time, plus RSS. The vectors are then
+compared with the fp32 PyTorch reference: per-text cosine similarity, and whether the same
+nearest neighbours are retrieved (recall@10).
+
+    python -m benchmarks.embedding_bench --backends torch,onnx,onnx-int8 --threads 2
+    python -m benchmarks.embedding_bench --backends torch,onnx-int8 --min-cosine 0.98
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+REFERENCE = "torch"
+
+SUBJECTS = ["I", "My mother", "My son", "A 45 year old patient", "My partner"]
+COMPLAINTS = [
+    "have had a persistent dry cough for two weeks", "get migraines with aura about twice a month",
+    "was diagnosed with type 2 diabetes last year", "feel short of breath when climbing stairs",
+    "have lower back pain after long drives", "take metformin and want to start running",
+    "have high blood pressure and drink a lot of coffee", "sleep less than five hours most nights",
+]
+QUESTIONS = [
+    "What could be causing this?", "Is there any research on treatments?", "Should I see a doctor?",
+    "Which lifestyle changes help the most?", "Are there side effects I should watch for?",
+    "Find recent clinical trials about it.",
+]
+
+def build_corpus(size: int, seed: int = 0):
+    """
+    Deterministic mix of short questions and longer multi-sentence messages
+    """
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(size):
+        parts = [f"{rng.choice(SUBJECTS)} {rng.choice(COMPLAINTS)}."]
+        parts += [rng.choice(QUESTIONS) for _ in range(rng.randint(0, 4))]
+        texts.append(" ".join(parts))
+    return texts
+
+def memory_mb():
+    """
+    Current and peak resident set size of this process in MB (Linux)
+    """
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    values[line.split(":")[0]] = int(line.split()[1]) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return peak, peak
+    return values.get("VmRSS", 0.0), values.get("VmHWM", 0.0)
+
+def run_worker(args):
+    """
+    Benchmark one backend in this process and print a JSON summary
+    """
+    start = time.perf_counter()
+    from backend.embeddings import load_embedding_model
+    model = load_embedding_model(backend=args.worker, threads=args.threads)
+    load_seconds = time.perf_counter() - start
+    rss_loaded, _ = memory_mb()
+
+    texts = build_corpus(args.texts)
+    model.encode(texts[:args.batch_size], batch_size=args.batch_size, convert_to_numpy=True)  # Warm-up
+
+    start = time.perf_counter()
+    vectors = model.encode(texts, batch_size=args.batch_size, convert_to_numpy=True)
+    batch_seconds = time.perf_counter() - start
+
+    singles = texts[:args.single_texts]
+    start = time.perf_counter()
+    for text in singles:
+        model.encode([text], batch_size=1, convert_to_numpy=True)
+    single_seconds = time.perf_counter() - start
+
+    rss, peak = memory_mb()
+    np.save(args.vectors_out, np.asarray(vectors, dtype=np.float32))
+    print(json.dumps({
+        "backend": args.worker,
+        "load_s": round(load_seconds, 2),
+        "encodes_per_s": round(len(texts) / batch_seconds, 1),
+        "single_encodes_per_s": round(len(singles) / single_seconds, 1) if singles else None,
+        "rss_loaded_mb": round(rss_loaded, 1),
+        "rss_mb": round(rss, 1),
+        "peak_rss_mb": round(peak, 1),
+    }))
+
+def accuracy(vectors: np.ndarray, reference: np.ndarray, queries: int = 100, k: int = 10):
+    """
+    Cosine similarity to the reference vectors and nearest-neighbour recall@k against the rest of the corpus
+    """
+    def unit(m):
+        return m / np.clip(np.linalg.norm(m, axis=1, keepdims=True), 1e-12, None)
+    vectors, reference = unit(vectors), unit(reference)
+    cosine = (vectors * reference).sum(axis=1)
+
+    queries = min(queries, len(vectors) // 2)
+    def neighbours(m):
+        scores = m[:queries] @ m[queries:].T
+        return np.argsort(-scores, axis=1)[:, :k]
+    ours, theirs = neighbours(vectors), neighbours(reference)
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ours, theirs)])
+    return {
+        "cosine_min": round(float(cosine.min()), 5),
+        "cosine_mean": round(float(cosine.mean()), 5),
+        f"recall_at_{k}": round(float(recall), 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--single-texts", type=int, default=200, help="Texts encoded one at a time (request path latency)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBEDDING_THREADS", "0")), help="Intra-op threads, 0 for the runtime default")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Fail when a backend's minimum cosine to fp32 is lower")
+    parser.add_argument("--output", default=None, help="JSON results path (default benchmarks/results/embedding-<timestamp>.json)")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--vectors-out", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    results = {}
+    vectors = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for backend in backends:
+            vectors_path = os.path.join(workdir, f"{backend}.npy")
+            command = [
+                sys.executable, "-m", "benchmarks.embedding_bench", "--worker", backend, "--vectors-out", vectors_path,
+                "--texts", str(args.texts), "--single-texts", str(args.single_texts),
+                "--batch-size", str(args.batch_size), "--threads", str(args.threads),
+            ]
+            start = time.perf_counter()
+            process = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+            if process.returncode != 0:
+                print(f"{backend}: failed\n{process.stderr.strip()[-2000:]}")
+                results[backend] = {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "failed"}
+                continue
+            results[backend] = json.loads(process.stdout.strip().splitlines()[-1])
+            results[backend]["process_s"] = round(time.perf_counter() - start, 2)
+            vectors[backend] = np.load(vectors_path)
+
+    failed = False
+    if REFERENCE in vectors:
+        for backend, matrix in vectors.items():
+            if backend == REFERENCE:
+                continue
+            results[backend].update(accuracy(matrix, vectors[REFERENCE]))
+            if results[backend]["cosine_min"] < args.min_cosine:
+                failed = True
+    else:
+        print(f"No {REFERENCE} reference vectors, accuracy check skipped")
+
+    columns = ("load_s", "encodes_per_s", "single_encodes_per_s", "rss_mb", "peak_rss_mb", "cosine_min", "cosine_mean", "recall_at_10")
+    print(f"{'backend':<10}" + "".join(f"{c:>22}" for c in columns))
+    for backend, summary in results.items():
+        if "error" in summary:
+            print(f"{backend:<10}  error: {summary['error']}")
+            continue
+        print(f"{backend:<10}" + "".join(f"{str(summary.get(c, '-')):>22}" for c in columns))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"embedding-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"texts": args.texts, "batch_size": args.batch_size, "threads": args.threads, "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+    if failed:
+        print(f"Accuracy check failed: minimum cosine to fp32 below {args.min_cosine}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Local stand-ins for the upstream services, for offline benchmarks and load tests.
+
+One FastAPI app serves:
+  - Zhipu chat completions   POST /api/paas/v4/chat/completions   (text, SSE streaming and voice replies)
+  - NCBI E-utilities         GET  /entrez/eutils/esearch.fcgi, /entrez/eutils/efetch.fcgi   (canned XML)
+  - Pinecone data plane      POST /vectors/upsert, /query, /vectors/delete, /describe_index_stats
+
+Latency is configured through environment variables (seconds):
+  FAKE_LLM_FIRST_TOKEN_LATENCY, FAKE_LLM_TOKEN_INTERVAL, FAKE_LLM_TOKENS,
+  FAKE_NCBI_LATENCY, FAKE_PINECONE_LATENCY
+
+    uvicorn benchmarks.fake_upstreams:app --port 9100
+"""
+import asyncio
+import base64
+import io
+import json
+import os
+import threading
+import wave
+import zlib
+from collections import defaultdict
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+FAKE_LLM_FIRST_TOKEN_LATENCY = float(os.getenv("FAKE_LLM_FIRST_TOKEN_LATENCY", "0.3"))
+FAKE_LLM_TOKEN_INTERVAL = float(os.getenv("FAKE_LLM_TOKEN_INTERVAL", "0.01"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "200"))
+FAKE_NCBI_LATENCY = float(os.getenv("FAKE_NCBI_LATENCY", "0.2"))
+FAKE_PINECONE_LATENCY = float(os.getenv("FAKE_PINECONE_LATENCY", "0.03"))
+
+app = FastAPI(title="Fake upstreams")
+
+# ====== Zhipu chat completions ======
+def _silence_wav(seconds: float = 1.0, rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(rate)
+        clip.writeframes(b"\0\0" * int(seconds * rate))
+    return buffer.getvalue()
+
+_REPLY_AUDIO = base64.b64encode(_silence_wav()).decode("ascii")
+
+def _tokens():
+    return [f"token{i} " for i in range(FAKE_LLM_TOKENS)]
+
+@app.post("/api/paas/v4/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(FAKE_LLM_FIRST_TOKEN_LATENCY)
+
+    if body.get("stream"):
+        async def events():
+            for token in _tokens():
+                chunk = {"choices": [{"index": 0, "delta": {"role": "assistant", "content": token}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(FAKE_LLM_TOKEN_INTERVAL)
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(FAKE_LLM_TOKEN_INTERVAL * FAKE_LLM_TOKENS)
+    message = {"role": "assistant", "content": "".join(_tokens())}
+    if body.get("model") == "glm-4-voice":
+        message["audio"] = {"data": _REPLY_AUDIO}
+    return {"choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": FAKE_LLM_TOKENS}}
+
+# ====== NCBI E-utilities ======
+_ARTICLE_XML = """<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>
+<ArticleTitle>Synthetic study {pmid} on {term}</ArticleTitle>
+<Abstract><AbstractText Label="BACKGROUND">Background of study {pmid}.</AbstractText>
+<AbstractText Label="RESULTS">Results of study {pmid}, which are entirely synthetic.</AbstractText></Abstract>
+</Article></MedlineCitation></PubmedArticle>"""
+
+@app.get("/entrez/eutils/esearch.fcgi")
+async def esearch(term: str = "", retmax: int = 3):
+    await asyncio.sleep(FAKE_NCBI_LATENCY)
+    base = zlib.crc32(term.lower().encode("utf-8")) % 1000000
+    return {"esearchresult": {"count": str(retmax), "idlist": [str(base + i) for i in range(retmax)]}}
+
+@app.get("/entrez/eutils/efetch.fcgi")
+async def efetch(id: str = ""):
+    await asyncio.sleep(FAKE_NCBI_LATENCY)
+    articles = "".join(_ARTICLE_XML.format(pmid=pmid, term="health") for pmid in id.split(",") if pmid)
+    return Response(f"<?xml version=\"1.0\"?><PubmedArticleSet>{articles}</PubmedArticleSet>", media_type="text/xml")
+
+# ====== Pinecone data plane ======
+_vectors = defaultdict(dict)  # namespace -> id -> (values, metadata)
+_vectors_lock = threading.Lock()
+
+@app.post("/vectors/upsert")
+async def pinecone_upsert(request: Request):
+    body = await request.json()
+    await asyncio.sleep(FAKE_PINECONE_LATENCY)
+    namespace = body.get("namespace", "")
+    with _vectors_lock:
+        for vector in body.get("vectors", []):
+            _vectors[namespace][vector["id"]] = (np.asarray(vector["values"], dtype=np.float32), vector.get("metadata") or {})
+    return {"upsertedCount": len(body.get("vectors", []))}
+
+@app.post("/query")
+async def pinecone_query(request: Request):
+    body = await request.json()
+    await asyncio.sleep(FAKE_PINECONE_LATENCY)
+    namespace = body.get("namespace", "")
+    query = np.asarray(body.get("vector", []), dtype=np.float32)
+    with _vectors_lock:
+        items = list(_vectors.get(namespace, {}).items())
+    matches = []
+    if items and query.size:
+        matrix = np.stack([values for _, (values, _) in items])
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        for row in np.argsort(-scores)[:body.get("topK", 3)]:
+            vector_id, (_, metadata) = items[row]
+            match = {"id": vector_id, "score": float(scores[row]), "values": []}
+            if body.get("includeMetadata"):
+                match["metadata"] = metadata
+            matches.append(match)
+    return {"matches": matches, "namespace": namespace, "usage": {"readUnits": 1}}
+
+@app.post("/vectors/delete")
+async def pinecone_delete(request: Request):
+    body = await request.json()
+    await asyncio.sleep(FAKE_PINECONE_LATENCY)
+    namespace = body.get("namespace", "")
+    with _vectors_lock:
+        if body.get("deleteAll"):
+            _vectors.pop(namespace, None)
+        else:
+            for vector_id in body.get("ids", []):
+                _vectors[namespace].pop(vector_id, None)
+    return {}
+
+@app.api_route("/describe_index_stats", methods=["GET", "POST"])
+async def pinecone_describe_index_stats():
+    with _vectors_lock:
+        namespaces = {ns: {"vectorCount": len(vectors)} for ns, vectors in _vectors.items()}
+    return JSONResponse({"namespaces": namespaces, "dimension": 384, "indexFullness": 0.0,
+                         "totalVectorCount": sum(ns["vectorCount"] for ns in namespaces.values())})
@@ -0,0 +1,305 @@
+"""
+Offline load test: drives the API at a fixed concurrency and reports latency percentiles and throughput.
+
+With --spawn, the fake upstreams (benchmarks/fake_upstreams.py) and the app are started as local
+uvicorn processes with every upstream URL, database and cache pointed at them / a temp directory,
+so no real Zhipu, NCBI or Pinecone traffic is generated.
+
+    python -m benchmarks.load_test --spawn --concurrency 16 --requests 200
+    python -m benchmarks.load_test --base-url http://localhost:8000 --scenarios health_chat
+    python -m benchmarks.load_test --spawn --compare benchmarks/results/20250101-120000.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import wave
+from datetime import datetime
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SCENARIOS = ("authenticate", "user_profile", "health_chat", "health_chat_stream", "voice_chat")
+
+PROMPTS = [
+    "What are the symptoms of flu?",
+    "Is there any research on intermittent fasting and blood pressure?",
+    "Given my profile, should I worry about my cholesterol?",
+    "Find a clinical trial about metformin.",
+    "How much sleep does an adult need?",
+]
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100.0 * len(sorted_values)) - 1))  # nearest rank
+    return sorted_values[index]
+
+def sample_wav(seconds: float = 2.0, rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(rate)
+        clip.writeframes(b"\0\0" * int(seconds * rate))
+    return buffer.getvalue()
+
+class Session:
+    """
+    A benchmark user with a valid access token
+    """
+    def __init__(self, username: str, token: str):
+        self.username = username
+        self.token = token
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+async def login(client: httpx.AsyncClient, username: str) -> Session:
+    response = await client.post("/api/authenticate", json={"username": username, "password": "bench-password"})
+    response.raise_for_status()
+    return Session(username, response.json()["access_token"])
+
+# ====== Scenarios: one request each, raising on failure ======
+async def run_authenticate(client, session, i):
+    response = await client.post("/api/authenticate", json={"username": session.username, "password": "bench-password"})
+    response.raise_for_status()
+
+async def run_user_profile(client, session, i):
+    profile = {"gender": "female", "age": 30 + i % 40, "medical_history": "seasonal allergies"}
+    response = await client.put(f"/api/user/{session.username}", json=profile, headers=session.headers)
+    response.raise_for_status()
+    response = await client.get(f"/api/user/{session.username}", headers=session.headers)
+    response.raise_for_status()
+
+async def run_health_chat(client, session, i):
+    prompt = f"{PROMPTS[i % len(PROMPTS)]} (case {i})"
+    response = await client.post("/api/health_chat/", json={"prompt": prompt}, headers=session.headers)
+    response.raise_for_status()
+
+async def run_health_chat_stream(client, session, i):
+    prompt = f"{PROMPTS[i % len(PROMPTS)]} (case {i})"
+    async with client.stream("POST", "/api/health_chat/", json={"prompt": prompt, "stream": True}, headers=session.headers) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            pass
+
+async def run_voice_chat(client, session, i, audio=sample_wav()):
+    response = await client.post("/api/voice_chat/", files={"file": ("bench.wav", audio, "audio/wav")}, headers=session.headers)
+    response.raise_for_status()
+    audio_url = response.json().get("audio_url")
+    if audio_url:
+        (await client.get(audio_url)).raise_for_status()
+
+RUNNERS = {
+    "authenticate": run_authenticate,
+    "user_profile": run_user_profile,
+    "health_chat": run_health_chat,
+    "health_chat_stream": run_health_chat_stream,
+    "voice_chat": run_voice_chat,
+}
+
+async def run_scenario(client, sessions, name: str, requests: int, concurrency: int):
+    runner = RUNNERS[name]
+    latencies = []
+    errors = []
+    next_index = iter(range(requests))
+
+    async def worker(worker_id):
+        session = sessions[worker_id % len(sessions)]
+        for i in next_index:
+            start = time.perf_counter()
+            try:
+                await runner(client, session, i)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+    }
+
+async def run_load_test(args):
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        run_id = uuid.uuid4().hex[:8]
+        sessions = await asyncio.gather(*(login(client, f"bench-{run_id}-{i}") for i in range(args.users)))
+        results = {}
+        for name in args.scenarios:
+            if args.warmup:
+                await run_scenario(client, sessions, name, args.warmup, min(args.concurrency, args.warmup))
+            results[name] = await run_scenario(client, sessions, name, args.requests, args.concurrency)
+            summary = results[name]
+            print(f"{name:<20} rps={summary['rps']:>8} p50={summary['latency_ms']['p50']:>9}ms "
+                  f"p95={summary['latency_ms']['p95']:>9}ms p99={summary['latency_ms']['p99']:>9}ms errors={summary['errors']}")
+        return results
+
+# ====== Local processes ======
+def wait_until_ready(url: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not become ready within {timeout}s")
+
+def spawn(args, workdir: str):
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    fake_env = {
+        **os.environ,
+        "FAKE_LLM_FIRST_TOKEN_LATENCY": str(args.llm_latency),
+        "FAKE_LLM_TOKEN_INTERVAL": str(args.llm_token_interval),
+        "FAKE_LLM_TOKENS": str(args.llm_tokens),
+        "FAKE_NCBI_LATENCY": str(args.ncbi_latency),
+        "FAKE_PINECONE_LATENCY": str(args.pinecone_latency),
+    }
+    app_env = {
+        **os.environ,
+        "SECRET_KEY": os.environ.get("SECRET_KEY", "benchmark-secret"),
+        "ZHIPU_API_KEY": "benchmark",
+        "PINECONE_API_KEY": "benchmark",
+        "ZHIPU_API_URL": f"{fake_url}/api/paas/v4/chat/completions",
+        "PUBMED_API_BASE_URL": f"{fake_url}/entrez/eutils/",
+        "PINECONE_INDEX_HOST": fake_url,
+        "VECTOR_STORE_BACKEND": args.vector_store,
+        "VECTOR_STORE_PATH": os.path.join(workdir, "vector_store"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'users.db')}",
+        "PUBMED_CACHE_PATH": os.path.join(workdir, "pubmed_cache.db"),
+        "CHAT_LOG_PATH": os.path.join(workdir, "chat_log.db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache"),
+        "VOICE_AUDIO_DIR": os.path.join(workdir, "voice_audio"),
+        "SEMANTIC_CACHE_ENABLED": "false",
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        app_env[key] = value
+
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "benchmarks.fake_upstreams:app", "--port", str(args.fake_port),
+                          "--log-level", "warning"], cwd=ROOT, env=fake_env),
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port), "--workers", str(args.workers),
+                          "--log-level", "warning"], cwd=ROOT, env=app_env),
+    ]
+    try:
+        wait_until_ready(f"{fake_url}/docs", args.startup_timeout)
+        wait_until_ready(f"http://127.0.0.1:{args.app_port}/readyz", args.startup_timeout)
+    except Exception:
+        stop(processes)
+        raise
+    return processes
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    print(f"\nComparison with {baseline_path}")
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        def delta(new, before):
+            return f"{(new - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{name:<20} rps {delta(summary['rps'], old['rps']):>8}  "
+              f"p50 {delta(summary['latency_ms']['p50'], old['latency_ms']['p50']):>8}  "
+              f"p99 {delta(summary['latency_ms']['p99'], old['latency_ms']['p99']):>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=None, help="Target an already running app instead of --spawn")
+    parser.add_argument("--spawn", action="store_true", help="Start fake upstreams and the app locally")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="Unrecorded requests per scenario")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", default=None, help="JSON results path (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to compare against")
+    spawn_group = parser.add_argument_group("--spawn options")
+    spawn_group.add_argument("--app-port", type=int, default=8001)
+    spawn_group.add_argument("--fake-port", type=int, default=9100)
+    spawn_group.add_argument("--workers", type=int, default=1)
+    spawn_group.add_argument("--vector-store", choices=["pinecone", "local"], default="pinecone",
+                             help="'pinecone' talks to the fake Pinecone data plane")
+    spawn_group.add_argument("--llm-latency", type=float, default=0.3, help="Fake Zhipu time to first token (s)")
+    spawn_group.add_argument("--llm-token-interval", type=float, default=0.01)
+    spawn_group.add_argument("--llm-tokens", type=int, default=200)
+    spawn_group.add_argument("--ncbi-latency", type=float, default=0.2)
+    spawn_group.add_argument("--pinecone-latency", type=float, default=0.03)
+    spawn_group.add_argument("--startup-timeout", type=float, default=180.0)
+    spawn_group.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra app environment")
+    args = parser.parse_args()
+
+    if not args.spawn and not args.base_url:
+        parser.error("pass --spawn or --base-url")
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="llm-health-bench-") as workdir:
+        if args.spawn:
+            processes = spawn(args, workdir)
+            args.base_url = f"http://127.0.0.1:{args.app_port}"
+        try:
+            results = asyncio.run(run_load_test(args))
+            metrics = httpx.get(f"{args.base_url}/metrics", timeout=10).text
+        finally:
+            stop(processes)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "scenarios": results,
+        "server_metrics": metrics,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
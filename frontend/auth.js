@@ -0,0 +1,55 @@
+// Access tokens are short-lived. On a 401 the stored refresh token is exchanged once for a new
+// token pair (no password check on the server) and the request is retried.
+let refreshInFlight = null;
+
+function storeTokens(data) {
+    localStorage.setItem("token", data.access_token);
+    if (data.refresh_token) localStorage.setItem("refreshToken", data.refresh_token);
+}
+
+function clearSession() {
+    localStorage.removeItem("token");
+    localStorage.removeItem("refreshToken");
+}
+
+async function refreshTokens() {
+    const refreshToken = localStorage.getItem("refreshToken");
+    if (!refreshToken) return false;
+    // Concurrent 401s share one refresh, refresh tokens are single-use
+    if (!refreshInFlight) {
+        refreshInFlight = fetch("/api/token/refresh", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ refresh_token: refreshToken }),
+        }).then(async (response) => {
+            if (!response.ok) return false;
+            storeTokens(await response.json());
+            return true;
+        }).catch(() => false).finally(() => { refreshInFlight = null; });
+    }
+    return refreshInFlight;
+}
+
+async function authFetch(url, options = {}) {
+    const send = () => fetch(url, {
+        ...options,
+        headers: { ...(options.headers || {}), "Authorization": `Bearer ${localStorage.getItem("token")}` },
+    });
+    let response = await send();
+    if (response.status === 401 && await refreshTokens()) {
+        response = await send();
+    }
+    return response;
+}
+
+async function revokeSession() {
+    const refreshToken = localStorage.getItem("refreshToken");
+    if (refreshToken) {
+        await fetch("/api/token/revoke", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ refresh_token: refreshToken }),
+        }).catch(() => {});
+    }
+    clearSession();
+}
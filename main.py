@@ -1,29 +1,73 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.routing import APIRouter
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
 from jose import JWTError, jwt
-from sqlalchemy import create_engine, Column, String, Integer
+from sqlalchemy import create_engine, event, inspect, text, Column, String, Integer, Boolean, DateTime
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 from passlib.context import CryptContext
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from pinecone import Pinecone
-from sentence_transformers import SentenceTransformer
+from typing import Optional
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import logging
 import os
+import secrets
+import sqlite3
 from dotenv import load_dotenv
 from backend.health_chat import router as health_chat_router
 from backend.query_pubmed import router as query_pubmed_router
 from backend.voice_chat import router as voice_chat_router
+from backend.http_clients import get_client, close_clients, ZHIPU, NCBI
+from backend.upstream import get_upstream
+from backend.pubmed_cache import pubmed_cache
+from backend.pubmed_service import efetch_batcher
+from backend.pubmed_index import pubmed_index
+from backend.embeddings import embedding_service
+from backend.vector_store import get_vector_store
+from backend.chat_writer import chat_writer
+from backend.chat_log import chat_log, USER
+from backend.semantic_cache import semantic_cache
+from backend.profile_cache import profile_cache
+from backend.vector_ids import profile_text, profile_vector_id, chat_vector_id
+from backend.metrics import MetricsMiddleware, stage, register_collector, render_metrics
 
 
 load_dotenv() 
 
 # ======== SQLite Settings ========
-DATABASE_URL = "sqlite:///./users.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./users.db")
+# Sized for the request thread pool: requests hold a connection only for a few short queries
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable across crashes in WAL mode, only a power loss can drop the last commits
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
+
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        # WAL lets readers proceed while a write is in progress; busy_timeout makes writers wait instead of failing
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
 SessionLocal = sessionmaker(bind=engine)
 Base = declarative_base()
 
@@ -36,15 +80,52 @@ class User(Base):
     age = Column(Integer, nullable=True)
     medical_history = Column(String, nullable=True)
 
+# ======== Refresh Token Table ========
+# Only a SHA-256 digest of each refresh token is stored; tokens are random, so no slow hash is needed
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    token_hash = Column(String, primary_key=True)
+    username = Column(String, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    revoked = Column(Boolean, nullable=False, default=False)
+    rotated = Column(Boolean, nullable=False, default=False)  # Revoked by a refresh rather than a logout
+
 Base.metadata.create_all(bind=engine)
+if "rotated" not in {column["name"] for column in inspect(engine).get_columns("refresh_tokens")}:
+    # Tables created before rotation was tracked
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE refresh_tokens ADD COLUMN rotated BOOLEAN NOT NULL DEFAULT 0"))
 
 # ======== Password encryption settings ========
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt runs in a bounded thread pool (it releases the GIL), so logins cannot occupy the event loop
+# or the request thread pool. Beyond PASSWORD_HASH_MAX_PENDING queued jobs, logins get a 503.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+password_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+password_pool_stats = {"pending": 0, "rejected": 0, "completed": 0}
+
+async def run_password_job(stage_name: str, func, *args):
+    """
+    Run a bcrypt hash/verify in the password pool, rejecting the request when the pool is saturated
+    """
+    if password_pool_stats["pending"] >= PASSWORD_HASH_MAX_PENDING:
+        password_pool_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Too many concurrent logins, please retry.")
+    password_pool_stats["pending"] += 1
+    try:
+        with stage(stage_name):
+            return await asyncio.get_running_loop().run_in_executor(password_pool, func, *args)
+    finally:
+        password_pool_stats["pending"] -= 1
+        password_pool_stats["completed"] += 1
+
 # ======== JWT Configuration ========
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 1 # Expiration time (x min)
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))  # Renewed through /api/token/refresh
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -55,11 +136,13 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})  # Add expiration time
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    with stage("jwt_encode"):
+        return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def verify_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with stage("jwt_verify"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise JWTError
@@ -67,20 +150,81 @@ def verify_token(token: str):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-# ======== Pinecone Initialization ========
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = "healthassistant"
-embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def issue_refresh_token(db: Session, username: str) -> str:
+    """
+    Create a refresh token for the user (the caller commits) and drop the user's expired ones
+    """
+    now = datetime.utcnow()
+    db.query(RefreshToken).filter(RefreshToken.username == username, RefreshToken.expires_at < now).delete()
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(token_hash=hash_refresh_token(token), username=username,
+                        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), revoked=False))
+    return token
+
+def issue_tokens(db: Session, username: str):
+    # The password may have been checked against a cached row; a user removed since then
+    # (e.g. by CLI_DB_Manager in another process) must not get new tokens
+    if db.query(User.username).filter(User.username == username).first() is None:
+        profile_cache.invalidate(username)
+        raise HTTPException(status_code=401, detail="User not found")
+    refresh_token = issue_refresh_token(db, username)
+    db.commit()
+    return {"access_token": create_access_token(data={"sub": username}), "refresh_token": refresh_token, "token_type": "bearer"}
 
-pc = Pinecone(api_key=PINECONE_API_KEY, environment="us-east-1-aws")
-existing_indexes = [index["name"] for index in pc.list_indexes()]
-if INDEX_NAME not in existing_indexes:
-    pc.create_index(name=INDEX_NAME, dimension=384, metric="cosine")
+# ======== Application Lifecycle ========
+# Heavy resources are initialised in parallel after uvicorn starts accepting connections,
+# so importing this module never touches the network. /readyz reports when they are done.
+readiness = {"embedding_model": "pending", "vector_store": "pending", "http_clients": "pending"}
 
-pinecone_index = pc.Index(INDEX_NAME)
+async def _initialize(component: str, init):
+    try:
+        await init()
+        readiness[component] = "ready"
+        logging.info(f"Startup: {component} ready")
+    except Exception as e:
+        readiness[component] = f"error: {e}"
+        logging.error(f"Startup: failed to initialise {component}: {e}")
+
+async def _init_embedding_model():
+    # Load MiniLM and run one warm-up inference so the first request does not pay for it
+    await asyncio.to_thread(embedding_service.warm_up)
+
+async def _init_vector_store():
+    # Pinecone (default) or the local memory-mapped backend, see VECTOR_STORE_BACKEND
+    await asyncio.to_thread(get_vector_store)
+
+async def _init_http_clients():
+    get_client(ZHIPU)
+    get_client(NCBI)
+
+async def initialize_resources():
+    await asyncio.gather(
+        _initialize("embedding_model", _init_embedding_model),
+        _initialize("vector_store", _init_vector_store),
+        _initialize("http_clients", _init_http_clients),
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = asyncio.ensure_future(initialize_resources())
+    yield
+    if not startup.done():
+        startup.cancel()
+    # Drain pending chat writes, then release pooled upstream connections and cache handles
+    await chat_writer.close()
+    await close_clients()
+    pubmed_cache.close()
+    if pubmed_index is not None:
+        pubmed_index.close()
+    chat_log.close()
+    embedding_service.shutdown()
+    password_pool.shutdown(wait=False)
 
 # ======== FastAPI Application ========
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Mount the static file directory
 app.mount("/static", StaticFiles(directory="frontend"), name="static")
@@ -92,8 +236,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per-stage latency histograms (/metrics) and Server-Timing response headers
+app.add_middleware(MetricsMiddleware)
+register_collector("upstream_zhipu", get_upstream(ZHIPU).stats)
+register_collector("upstream_ncbi", get_upstream(NCBI).stats)
+register_collector("pubmed_cache", pubmed_cache.stats)
+register_collector("pubmed_efetch", efetch_batcher.stats)
+register_collector("pubmed_index", lambda: pubmed_index.stats() if pubmed_index is not None else {})
+register_collector("embedding_service", embedding_service.stats)
+register_collector("embedding_cache", lambda: embedding_service.cache.stats() if embedding_service.cache is not None else {})
+register_collector("semantic_cache", semantic_cache.stats)
+register_collector("chat_writer", chat_writer.stats)
+register_collector("chat_log", chat_log.stats)
+register_collector("profile_cache", profile_cache.stats)
+register_collector("password_pool", lambda: {**password_pool_stats, "workers": PASSWORD_HASH_WORKERS})
+
 # Integrate sub-applications using APIRouter
 router = APIRouter()
 router.include_router(health_chat_router)
@@ -102,6 +262,20 @@ router.include_router(voice_chat_router)
 
 app.include_router(router)
 
+# ======== Liveness and Readiness Probes ========
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    ready = all(state == "ready" for state in readiness.values())
+    return JSONResponse(status_code=200 if ready else 503, content={"status": "ready" if ready else "not ready", "components": readiness})
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # ======== Pydantic Data Model========
 class RegisterRequest(BaseModel):
     username: str
@@ -111,6 +285,9 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class UserProfile(BaseModel):
     gender: str
     age: int
@@ -124,22 +301,86 @@ def get_db():
     finally:
         db.close()
 
+# ======== Read-through user cache ========
+def load_user(db: Session, username: str):
+    """
+    User row as a plain dict, served from the profile cache when possible (None if the user does not exist)
+    """
+    record = profile_cache.get(username)
+    if record is not None:
+        return record
+    generation = profile_cache.begin(username)
+    with stage("user_query"):
+        user = db.query(User).filter(User.username == username).first()
+    if user is None:
+        return None
+    record = {
+        "username": user.username,
+        "hashed_password": user.hashed_password,
+        "gender": user.gender,
+        "age": user.age,
+        "medical_history": user.medical_history,
+    }
+    profile_cache.set(username, record, generation)
+    return record
+
 # ======== Register (auto login) ========
+def create_user(db: Session, username: str, hashed_password: str):
+    db.add(User(username=username, hashed_password=hashed_password))
+    db.commit()
+    profile_cache.invalidate(username)
+
 @app.post("/api/authenticate")
-def authenticate(user: LoginRequest, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
+async def authenticate(user: LoginRequest, db: Session = Depends(get_db)):
+    # Only the bcrypt jobs are awaited on the event loop; the blocking SQLAlchemy calls run in the
+    # thread pool, so a locked database (SQLITE_BUSY_TIMEOUT_MS) cannot stall other requests
+    db_user = await run_in_threadpool(load_user, db, user.username)
 
     if db_user:
-        if not pwd_context.verify(user.password, db_user.hashed_password):
+        password_ok = await run_password_job("password_verify", pwd_context.verify, user.password, db_user["hashed_password"])
+        if not password_ok:
             raise HTTPException(status_code=401, detail="Incorrect password.")
     else:
-        hashed_password = pwd_context.hash(user.password)
-        new_user = User(username=user.username, hashed_password=hashed_password)
-        db.add(new_user)
+        hashed_password = await run_password_job("password_hash", pwd_context.hash, user.password)
+        await run_in_threadpool(create_user, db, user.username, hashed_password)
+
+    return await run_in_threadpool(issue_tokens, db, user.username)
+
+# ======== Renew the access token without a password check ========
+@app.post("/api/token/refresh")
+def refresh_access_token(request: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access token and a new refresh token (rotation).
+    Presenting an already rotated refresh token revokes every session of its user; one revoked
+    by a logout is only rejected, so a stale tab after a logout does not end the other sessions.
+    """
+    token_hash = hash_refresh_token(request.refresh_token)
+    stored = db.query(RefreshToken).filter(RefreshToken.token_hash == token_hash).first()
+    if stored is None or stored.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+
+    # Conditional update, so two concurrent refreshes with the same token cannot both succeed
+    rotated = db.query(RefreshToken).filter(RefreshToken.token_hash == token_hash, RefreshToken.revoked.is_(False)).update(
+        {"revoked": True, "rotated": True}, synchronize_session=False
+    )
+    if not rotated:
+        if not stored.rotated:
+            raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+        db.query(RefreshToken).filter(RefreshToken.username == stored.username).update({"revoked": True}, synchronize_session=False)
         db.commit()
+        logging.warning(f"Refresh token reuse detected for {stored.username}, all sessions revoked")
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
 
-    access_token = create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    return issue_tokens(db, stored.username)
+
+# ======== Logout: revoke a refresh token ========
+@app.post("/api/token/revoke")
+def revoke_refresh_token(request: RefreshRequest, db: Session = Depends(get_db)):
+    db.query(RefreshToken).filter(RefreshToken.token_hash == hash_refresh_token(request.refresh_token)).update(
+        {"revoked": True}, synchronize_session=False
+    )
+    db.commit()
+    return {"message": "Refresh token revoked"}
 
 # Authenticating user access to the Dashboard
 @app.get("/api/verify")
@@ -154,10 +395,10 @@ def get_user(username: str, db: Session = Depends(get_db), token: str = Depends(
     current_user = verify_token(token)
     if current_user != username:
         raise HTTPException(status_code=403, detail="Access denied.")
-    user = db.query(User).filter(User.username == username).first()
+    user = load_user(db, username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"username": user.username, "gender": user.gender, "age": user.age, "medical_history": user.medical_history}
+    return {"username": user["username"], "gender": user["gender"], "age": user["age"], "medical_history": user["medical_history"]}
 
 # ======== Update user information (overwrite storage) ========
 @app.put("/api/user/{username}")
@@ -175,18 +416,21 @@ def update_user(username: str, profile: UserProfile, db: Session = Depends(get_d
     user.age = profile.age
     user.medical_history = profile.medical_history
     db.commit()
+    profile_cache.invalidate(username)
 
     # Delete Profile data (keep other data)
     try:
-        pinecone_index.delete(ids=[f"profile-{username}"], namespace=username)  # Delete only the user's Profile data
+        with stage("vector_delete"):
+            get_vector_store().delete(ids=[profile_vector_id(username)], namespace=username)  # Delete only the user's Profile data
     except Exception as e:
         print(f"Error deleting profile from Pinecone for user {username}: {e}")
 
     # Upload new Profile data to Pinecone
     try:
-        prompt = f"My gender is {user.gender}, my age is {user.age}, and I have a medical history of {user.medical_history}."
-        vector = embedding_model.encode([prompt])[0].tolist()
-        pinecone_index.upsert([(f"profile-{username}", vector, {"text": prompt})], namespace=username)
+        prompt = profile_text(profile.gender, profile.age, profile.medical_history)
+        vector = embedding_service.encode([prompt])[0].tolist()
+        with stage("vector_write"):
+            get_vector_store().upsert([(profile_vector_id(username), vector, {"text": prompt})], namespace=username)
     except Exception as e:
         print(f"Error uploading profile to Pinecone for user {username}: {e}")
 
@@ -195,25 +439,41 @@ def update_user(username: str, profile: UserProfile, db: Session = Depends(get_d
 
 # ======== Processing chat history ========
 @app.post("/api/chat")
-def chat_with_model(username: str, message: str, token: str = Depends(oauth2_scheme)):
+async def chat_with_model(username: str, message: str, token: str = Depends(oauth2_scheme)):
     current_user = verify_token(token)
     if current_user != username:
         raise HTTPException(status_code=403, detail="Access denied.")
-    vector = embedding_model.encode([message])[0].tolist()
-    pinecone_index.upsert([(f"chat-{username}-{message[:10]}", vector, {"text": message})], namespace=username)
-    return {"message": "Chat stored"}
+    try:
+        with stage("chat_log_append"):
+            (turn_id,) = await asyncio.to_thread(chat_log.append, username, [(USER, message)])
+    except sqlite3.Error as e:
+        logging.error(f"Error appending chat message for {username}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to store chat message.")
+    # The message is stored once it is in the chat log, so an overloaded write-behind queue must not
+    # fail the request (a retry would log it twice). Dropped vectors can be rebuilt from the log by backend.reembed.
+    if not await chat_writer.enqueue(username, [(chat_vector_id(username, USER, turn_id), message, {"turn_id": turn_id, "role": USER})]):
+        logging.warning(f"Chat turn {turn_id} for {username} is in the chat log but its vector was dropped")
+    return {"message": "Chat stored", "turn_id": turn_id}
 
 # ======== Query user chat history ========
 @app.get("/api/chat/{username}")
-def get_chat_history(username: str, top_k: int = 3, token: str = Depends(oauth2_scheme)):
+def get_chat_history(username: str, top_k: int = 3, before: Optional[int] = None, token: str = Depends(oauth2_scheme)):
+    """
+    Latest `top_k` messages from the chat log, oldest first. Pass the returned `next_before`
+    as `before` to page further back.
+    """
     current_user = verify_token(token)
     if current_user != username:
         raise HTTPException(status_code=403, detail="Access denied.")
-    user_query_vector = embedding_model.encode([f"Retrieve last {top_k} messages"]).tolist()
-    results = pinecone_index.query(vector=user_query_vector, top_k=top_k, include_metadata=True, namespace=username)
-
-    chat_history = [r["metadata"]["text"] for r in results.get("matches", [])]
-    return {"chat_history": chat_history if chat_history else ["No chat history found."]}
+    with stage("chat_log_read"):
+        turns, next_before = chat_log.recent(username, limit=top_k, before=before)
+
+    chat_history = [turn["content"] for turn in turns]
+    return {
+        "chat_history": chat_history if chat_history else ["No chat history found."],
+        "turns": turns,
+        "next_before": next_before,
+    }
 
 # By default, it will direct to index.html
 @app.get("/")
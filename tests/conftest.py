@@ -0,0 +1,20 @@
+"""
+Point every on-disk store at a throwaway directory before any application module reads its configuration.
+"""
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="llm-health-tests-")
+
+os.environ.update({
+    "SECRET_KEY": "test-secret",
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'users.db')}",
+    "CHAT_LOG_PATH": os.path.join(_workdir, "chat_log.db"),
+    "VECTOR_STORE_BACKEND": "local",
+    "VECTOR_STORE_PATH": os.path.join(_workdir, "vector_store"),
+    "PUBMED_CACHE_PATH": "",
+    "PUBMED_INDEX_PATH": "",
+    "EMBEDDING_CACHE_PATH": "",
+    "VOICE_AUDIO_DIR": os.path.join(_workdir, "voice_audio"),
+    "SEMANTIC_CACHE_ENABLED": "false",
+})
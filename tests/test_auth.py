@@ -0,0 +1,58 @@
+"""
+Login and refresh-token rotation against a throwaway users database (see conftest.py).
+"""
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+@pytest.fixture
+def client():
+    # Without the lifespan: no model loading or upstream clients, only the auth routes are exercised
+    return TestClient(main.app)
+
+def login(client, username=None, password="correct horse battery"):
+    username = username or f"user-{uuid.uuid4().hex[:8]}"
+    response = client.post("/api/authenticate", json={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return username, response.json()
+
+def refresh(client, refresh_token):
+    return client.post("/api/token/refresh", json={"refresh_token": refresh_token})
+
+def test_login_registers_then_checks_the_password(client):
+    username, tokens = login(client)
+    assert main.verify_token(tokens["access_token"]) == username
+    login(client, username)
+    response = client.post("/api/authenticate", json={"username": username, "password": "wrong password"})
+    assert response.status_code == 401
+
+def test_refresh_rotates_the_token(client):
+    username, tokens = login(client)
+    response = refresh(client, tokens["refresh_token"])
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert main.verify_token(rotated["access_token"]) == username
+    assert refresh(client, rotated["refresh_token"]).status_code == 200
+
+def test_reusing_a_rotated_token_revokes_every_session(client):
+    username, first = login(client)
+    _, other_device = login(client, username)
+    current = refresh(client, first["refresh_token"]).json()
+
+    assert refresh(client, first["refresh_token"]).status_code == 401  # Replayed, e.g. by a thief
+    assert refresh(client, current["refresh_token"]).status_code == 401
+    assert refresh(client, other_device["refresh_token"]).status_code == 401
+
+def test_unknown_refresh_token_is_rejected(client):
+    assert refresh(client, "not-a-token").status_code == 401
+
+def test_refresh_after_logout_only_rejects_that_token(client):
+    username, tab = login(client)
+    _, other_device = login(client, username)
+    assert client.post("/api/token/revoke", json={"refresh_token": tab["refresh_token"]}).status_code == 200
+
+    assert refresh(client, tab["refresh_token"]).status_code == 401  # A stale tab after the logout
+    assert refresh(client, other_device["refresh_token"]).status_code == 200
@@ -0,0 +1,54 @@
+"""
+Chat log: keyset pagination of a user's history, log-order scans and bulk deletes.
+"""
+import pytest
+
+from backend.chat_log import ChatLog, USER, MODEL
+
+@pytest.fixture
+def log(tmp_path):
+    chat_log = ChatLog(str(tmp_path / "chat_log.db"))
+    yield chat_log
+    chat_log.close()
+
+def test_append_returns_unique_turn_ids(log):
+    turn_ids = log.append("amy", [(USER, "hi"), (MODEL, "hello")])
+    assert len(set(turn_ids)) == 2
+    turns, _ = log.recent("amy", 10)
+    assert [(t["turn_id"], t["role"], t["content"]) for t in turns] == [(turn_ids[0], USER, "hi"), (turn_ids[1], MODEL, "hello")]
+
+def test_recent_pages_back_through_history(log):
+    for i in range(7):
+        log.append("amy", [(USER, f"amy {i}")])
+        log.append("bob", [(USER, f"bob {i}")])
+
+    pages = []
+    before = None
+    while True:
+        turns, before = log.recent("amy", 3, before)
+        pages.append([t["content"] for t in turns])
+        if before is None:
+            break
+    assert pages == [["amy 4", "amy 5", "amy 6"], ["amy 1", "amy 2", "amy 3"], ["amy 0"]]
+
+def test_recent_exact_page_has_no_next_cursor(log):
+    for i in range(3):
+        log.append("amy", [(USER, str(i))])
+    turns, before = log.recent("amy", 3)
+    assert [t["content"] for t in turns] == ["0", "1", "2"]
+    assert before is None
+    assert log.recent("nobody", 3) == ([], None)
+
+def test_scan_resumes_after_a_sequence_number(log):
+    log.append("amy", [(USER, "a"), (MODEL, "b")])
+    log.append("bob", [(USER, "c")])
+    rows = list(log.scan(0, batch_size=1))
+    assert [(username, content) for _, _, username, _, content in rows] == [("amy", "a"), ("amy", "b"), ("bob", "c")]
+    assert [row[4] for row in log.scan(rows[1][0])] == ["c"]
+
+def test_delete_users(log):
+    log.append("amy", [(USER, "a"), (MODEL, "b")])
+    log.append("bob", [(USER, "c")])
+    assert log.delete_users(["amy", "carol"]) == 2
+    assert log.recent("amy", 10) == ([], None)
+    assert len(log.recent("bob", 10)[0]) == 1
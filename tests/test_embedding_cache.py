@@ -0,0 +1,47 @@
+"""
+Embedding cache: in-memory LRU budget and the mmap store shared by several workers.
+"""
+import numpy as np
+
+from backend.embedding_cache import EmbeddingCache, MmapVectorStore, cache_key, DIGEST_SIZE
+
+def vector(i):
+    return np.full(4, float(i), dtype=np.float32)
+
+def test_cache_key_depends_on_model_and_text():
+    assert cache_key("a", "text") == cache_key("a", "text")
+    assert cache_key("a", "text") != cache_key("b", "text")
+    assert len(cache_key("a", "text")) == DIGEST_SIZE
+
+def test_lru_stays_within_budget():
+    cache = EmbeddingCache(max_bytes=3 * (16 + DIGEST_SIZE), path="")
+    for i in range(5):
+        cache.put("m", str(i), vector(i))
+    assert cache.get("m", "0") is None
+    assert cache.get("m", "4")[0] == 4
+    assert cache.stats()["evictions"] == 2
+
+def test_stores_sharing_a_directory_do_not_reuse_rows(tmp_path):
+    # Two handles stand in for two uvicorn workers, each with its own in-memory index
+    first, second = MmapVectorStore(str(tmp_path)), MmapVectorStore(str(tmp_path))
+    for i in range(0, 20, 2):
+        first.put(cache_key("m", str(i)), vector(i))
+        second.put(cache_key("m", str(i + 1)), vector(i + 1))
+    second.put(cache_key("m", "0"), vector(99))  # Already stored by the other handle, kept as is
+    assert second.get(cache_key("m", "0"))[0] == 0
+
+    reloaded = MmapVectorStore(str(tmp_path))
+    assert len(reloaded) == 20
+    for i in range(20):
+        assert reloaded.get(cache_key("m", str(i)))[0] == i
+
+def test_torn_key_record_is_dropped(tmp_path):
+    store = MmapVectorStore(str(tmp_path))
+    store.put(cache_key("m", "a"), vector(1))
+    with open(tmp_path / "keys.bin", "ab") as f:
+        f.write(b"torn")
+    store = MmapVectorStore(str(tmp_path))
+    store.put(cache_key("m", "b"), vector(2))
+    reloaded = MmapVectorStore(str(tmp_path))
+    assert len(reloaded) == 2
+    assert reloaded.get(cache_key("m", "b"))[0] == 2
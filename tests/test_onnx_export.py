@@ -0,0 +1,43 @@
+"""
+ONNX export of the embedder, fp32 and int8, on a tiny randomly initialised BERT (no download).
+Runs whenever the export dependencies are installed, like in the Docker export stage.
+"""
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from backend.onnx_embedder import export, OnnxEmbedder, FP32_FILE, INT8_FILE, TOKENIZER_FILE
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "the", "cough", "fever", "sleep", "and", "a"]
+
+@pytest.fixture
+def tiny_model(tmp_path):
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(VOCAB))
+    config = transformers.BertConfig(
+        vocab_size=len(VOCAB), hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64,
+    )
+    model_dir = tmp_path / "model"
+    transformers.BertModel(config).save_pretrained(model_dir)
+    transformers.BertTokenizerFast(vocab_file=str(vocab_file)).save_pretrained(model_dir)
+    return str(model_dir)
+
+def test_export_int8(tiny_model, tmp_path):
+    output = str(tmp_path / "onnx")
+    export(tiny_model, output, int8=True)
+    for name in (FP32_FILE, INT8_FILE, TOKENIZER_FILE):
+        assert os.path.exists(os.path.join(output, name))
+
+    texts = ["the cough", "fever and sleep", "a", "sleep sleep sleep the fever and a cough"]
+    fp32 = OnnxEmbedder(output).encode(texts, batch_size=2)
+    int8 = OnnxEmbedder(output, quantized=True).encode(texts, batch_size=2)
+    assert fp32.shape == int8.shape == (len(texts), 32)
+    np.testing.assert_allclose(np.linalg.norm(fp32, axis=1), 1.0, atol=1e-5)
+    # Batching and padding must not change a text's vector
+    np.testing.assert_allclose(OnnxEmbedder(output).encode(texts[:1]), fp32[:1], atol=1e-5)
+    assert ((fp32 * int8).sum(axis=1) > 0.9).all()
@@ -0,0 +1,79 @@
+"""
+PubMed cache keys and the cached esearch path, with NCBI replaced by a fake.
+"""
+import asyncio
+import time
+import pytest
+
+import backend.pubmed_service as pubmed_service
+from backend.pubmed_cache import PubMedCache, MemoryLRU, normalize_query, collapse_whitespace, SEARCH, ARTICLE
+
+def test_normalize_query_folds_case_and_whitespace():
+    assert normalize_query("  Migraine\tWith  AURA ") == "migraine with aura"
+    assert normalize_query("migraine with aura") == normalize_query("MIGRAINE   with Aura")
+
+def test_normalize_query_keeps_boolean_operators():
+    assert normalize_query("Cough AND  fever NOT covid") == "cough AND fever NOT covid"
+    assert normalize_query("cough AND fever") != normalize_query("cough and fever")
+
+def test_memory_lru_evicts_oldest_and_expires():
+    lru = MemoryLRU(2)
+    later = time.time() + 60
+    lru.set("a", 1, later)
+    lru.set("b", 2, later)
+    assert lru.get("a") == 1  # Now most recently used
+    lru.set("c", 3, later)
+    assert (lru.get("a"), lru.get("b"), lru.get("c")) == (1, None, 3)
+    assert lru.evictions == 1
+    lru.set("old", 4, time.time() - 1)
+    assert lru.get("old") is None
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def run():
+        first = PubMedCache(path=path)
+        await first.set_many(ARTICLE, {"111": {"pmid": "111"}})
+        first.close()
+        second = PubMedCache(path=path)
+        found = await second.get_many(ARTICLE, ["111", "222"])
+        again = await second.get_many(ARTICLE, ["111"])
+        searches = await second.get_many(SEARCH, ["111"])
+        second.close()
+        return found, again, searches, second.stats()
+
+    found, again, searches, stats = asyncio.run(run())
+    assert found == again == {"111": {"pmid": "111"}}
+    assert searches == {}  # Kinds do not share keys
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 2)
+
+@pytest.fixture
+def fake_esearch(monkeypatch, tmp_path):
+    sent = []
+
+    async def esearch(query, max_results):
+        sent.append(query)
+        return [str(len(sent))]
+
+    monkeypatch.setattr(pubmed_service, "esearch", esearch)
+    monkeypatch.setattr(pubmed_service, "pubmed_cache", PubMedCache(path=str(tmp_path / "cache.db")))
+    return sent
+
+def test_cached_esearch_sends_the_query_as_written(fake_esearch):
+    async def run():
+        first = await pubmed_service.cached_esearch("Metformin  AND Exercise", 5)
+        again = await pubmed_service.cached_esearch("metformin AND exercise", 5)
+        other = await pubmed_service.cached_esearch("metformin and exercise", 5)
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert fake_esearch == [collapse_whitespace("Metformin  AND Exercise"), "metformin and exercise"]
+    assert first == again == ["1"]
+    assert other == ["2"]
+
+def test_cached_esearch_coalesces_concurrent_misses(fake_esearch):
+    async def run():
+        return await asyncio.gather(*(pubmed_service.cached_esearch("sleep apnea", 5) for _ in range(5)))
+
+    assert asyncio.run(run()) == [["1"]] * 5
+    assert fake_esearch == ["sleep apnea"]
@@ -0,0 +1,57 @@
+"""
+PubMed XML: the incremental efetch parser fed in arbitrary chunks, and baseline/update file streaming.
+"""
+import gzip
+
+from backend.pubmed_xml import ArticleStreamParser, parse_articles, iter_pubmed_file
+
+EFETCH = b"""<?xml version="1.0" ?>
+<PubmedArticleSet>
+<PubmedArticle><MedlineCitation><PMID Version="1">111</PMID><Article>
+<ArticleTitle>Metformin and <i>exercise</i> capacity</ArticleTitle>
+<Abstract>
+<AbstractText Label="BACKGROUND">Why it matters.</AbstractText>
+<AbstractText Label="RESULTS">VO<sub>2</sub> max rose.</AbstractText>
+<AbstractText></AbstractText>
+</Abstract>
+</Article></MedlineCitation></PubmedArticle>
+<PubmedArticle><MedlineCitation><PMID Version="1">222</PMID><Article>
+<ArticleTitle>Sleep &amp; blood pressure</ArticleTitle>
+<Abstract><AbstractText>Unstructured abstract.</AbstractText></Abstract>
+</Article></MedlineCitation></PubmedArticle>
+<PubmedArticle><MedlineCitation><PMID Version="1">333</PMID><Article></Article></MedlineCitation></PubmedArticle>
+</PubmedArticleSet>
+"""
+
+EXPECTED = [
+    {"pmid": "111", "title": "Metformin and exercise capacity", "abstract": "BACKGROUND: Why it matters.\nRESULTS: VO2 max rose."},
+    {"pmid": "222", "title": "Sleep & blood pressure", "abstract": "Unstructured abstract."},
+    {"pmid": "333", "title": "No title", "abstract": "No abstract available"},
+]
+
+def test_parse_complete_document():
+    assert parse_articles(EFETCH) == EXPECTED
+    assert parse_articles(EFETCH.decode("utf-8")) == EXPECTED
+
+def test_chunked_feed_matches_whole_document():
+    for size in (1, 7, 64, 1000):
+        parser = ArticleStreamParser()
+        articles = []
+        for start in range(0, len(EFETCH), size):
+            articles += parser.feed(EFETCH[start:start + size])
+        articles += parser.close()
+        assert articles == EXPECTED, size
+
+def test_articles_are_returned_as_soon_as_they_end():
+    parser = ArticleStreamParser()
+    cut = EFETCH.index(b"</PubmedArticle>") + len(b"</PubmedArticle>")
+    assert [a["pmid"] for a in parser.feed(EFETCH[:cut])] == ["111"]
+    assert [a["pmid"] for a in parser.feed(EFETCH[cut:]) + parser.close()] == ["222", "333"]
+
+def test_iter_pubmed_file_yields_upserts_and_deletes(tmp_path):
+    update = EFETCH.replace(b"</PubmedArticleSet>", b"<DeleteCitation><PMID>9</PMID><PMID>10</PMID></DeleteCitation></PubmedArticleSet>")
+    path = tmp_path / "pubmed25n0001.xml.gz"
+    with gzip.open(path, "wb") as f:
+        f.write(update)
+    events = list(iter_pubmed_file(str(path)))
+    assert events == [("upsert", record) for record in EXPECTED] + [("delete", "9"), ("delete", "10")]
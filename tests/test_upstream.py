@@ -0,0 +1,105 @@
+"""
+Upstream call policy: retries, circuit breaker and request deadlines, against fake operations.
+"""
+import asyncio
+import httpx
+import pytest
+
+from backend.upstream import (Upstream, CircuitBreaker, CircuitOpenError, DeadlineExceeded, RetryableStatus, UpstreamError,
+                              deadline)
+
+def make_upstream(threshold=3, attempts=1):
+    return Upstream("test", attempts=attempts, base_delay=0.001, max_delay=0.001,
+                    breaker=CircuitBreaker(failure_threshold=threshold, reset_timeout=60), hedge_min_samples=10**6)
+
+async def hang(timeout):
+    await asyncio.sleep(10)
+
+def call(upstream, op, timeout, **kwargs):
+    return asyncio.run(upstream.call(op, timeout, **kwargs))
+
+def test_timeouts_open_breaker():
+    upstream = make_upstream()
+    for _ in range(3):
+        with pytest.raises(UpstreamError, match="timed out"):
+            call(upstream, hang, 0.02)
+    assert upstream.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        call(upstream, hang, 0.02)
+    assert upstream.counters["rejected"] == 1
+
+def test_timeouts_inside_a_longer_deadline_open_breaker():
+    upstream = make_upstream()
+
+    async def run():
+        with deadline(5):
+            await upstream.call(hang, 0.02)
+
+    for _ in range(3):
+        with pytest.raises(UpstreamError):
+            asyncio.run(run())
+    assert upstream.breaker.state == CircuitBreaker.OPEN
+
+def test_client_timeout_before_deadline_counts_as_failure():
+    upstream = make_upstream()
+
+    async def read_timeout(timeout):
+        raise httpx.ReadTimeout("read timed out")
+
+    async def run():
+        with deadline(0.5):
+            await upstream.call(read_timeout, 1.0)  # Budget is capped by the deadline, which has not passed
+
+    for _ in range(3):
+        with pytest.raises(UpstreamError) as raised:
+            asyncio.run(run())
+        assert not isinstance(raised.value, DeadlineExceeded)
+    assert upstream.breaker.state == CircuitBreaker.OPEN
+
+def test_expired_deadline_does_not_count_against_upstream():
+    upstream = make_upstream(threshold=1)
+
+    async def run():
+        with deadline(0.02):
+            await upstream.call(hang, 1.0)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert upstream.breaker.state == CircuitBreaker.CLOSED
+    assert upstream.breaker.failures == 0
+
+def test_idempotent_calls_retry_retryable_status():
+    upstream = make_upstream(attempts=3)
+    attempts = []
+
+    async def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise RetryableStatus(503)
+        return "ok"
+
+    assert call(upstream, flaky, 1.0, idempotent=True) == "ok"
+    assert len(attempts) == 3
+    assert upstream.breaker.failures == 0
+
+def test_non_idempotent_calls_are_not_retried_once_sent():
+    upstream = make_upstream(attempts=3)
+    attempts = []
+
+    async def failing(timeout):
+        attempts.append(timeout)
+        raise RetryableStatus(500)
+
+    with pytest.raises(UpstreamError):
+        call(upstream, failing, 1.0)
+    assert len(attempts) == 1
+    assert upstream.breaker.failures == 1
+
+def test_half_open_probe_closes_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # Only one probe at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
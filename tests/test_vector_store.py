@@ -0,0 +1,88 @@
+"""
+Local vector store: exact top-k, the metadata log and its compaction, reloads and several handles on one directory.
+"""
+import json
+import os
+import numpy as np
+import pytest
+
+import backend.vector_store as vector_store
+from backend.vector_store import LocalVectorStore
+
+DIM = 4
+
+def unit(i):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i % DIM] = 1.0
+    return vector.tolist()
+
+def contents(store, namespace="user"):
+    return {vector_id: metadata for page in store.iter_vectors(namespace) for vector_id, metadata in page}
+
+@pytest.fixture(autouse=True)
+def small_log(monkeypatch):
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_COMPACT_MIN_ENTRIES", 4)
+
+def test_query_ranks_by_cosine(tmp_path):
+    store = LocalVectorStore(str(tmp_path), DIM)
+    store.upsert([("a", [1, 0, 0, 0], {"text": "a"}), ("b", [1, 1, 0, 0], {"text": "b"}), ("c", [0, 0, 1, 0], {"text": "c"})], "user")
+    matches = store.query([1, 0, 0, 0], 2, "user")["matches"]
+    assert [m["id"] for m in matches] == ["a", "b"]
+    assert matches[0]["score"] == pytest.approx(1.0)
+    assert store.query([1, 0, 0, 0], 2, "nobody") == {"matches": []}
+
+def test_upsert_delete_compaction_and_reload(tmp_path):
+    store = LocalVectorStore(str(tmp_path), DIM)
+    expected = {}
+    for i in range(12):
+        store.upsert([(f"id{i}", unit(i), {"i": i})], "user")
+        expected[f"id{i}"] = {"i": i}
+        if i % 3 == 2:
+            store.delete([f"id{i - 1}", "missing"], "user")
+            del expected[f"id{i - 1}"]
+    store.upsert([("id0", unit(1), {"i": "updated"})], "user")
+    expected["id0"] = {"i": "updated"}
+
+    directory = os.path.join(str(tmp_path), "user")
+    with open(os.path.join(directory, "records.json")) as f:
+        generation = json.load(f)["generation"]
+    assert generation > 0
+    assert sorted(os.listdir(directory)) == ["records-%d.log" % generation, "records.json", "vectors.f32"]
+
+    reloaded = LocalVectorStore(str(tmp_path), DIM)
+    assert contents(reloaded) == expected
+    assert reloaded.query(unit(1), 1, "user")["matches"][0]["id"] in {"id0", "id5", "id9"}
+    assert reloaded.describe_index_stats()["namespaces"] == {"user": {"vector_count": len(expected)}}
+
+def test_legacy_snapshot_and_torn_log_entry(tmp_path):
+    directory = tmp_path / "user"
+    directory.mkdir()
+    (directory / "records.json").write_text(json.dumps({"dim": DIM, "ids": [], "metadata": []}))
+    store = LocalVectorStore(str(tmp_path), DIM)
+    store.upsert([("a", unit(0), {"text": "a"})], "user")
+    with open(directory / "records-0.log", "a") as f:
+        f.write('["u", "b", {"te')  # A writer crashed mid-entry
+
+    store = LocalVectorStore(str(tmp_path), DIM)
+    store.upsert([("c", unit(2), {"text": "c"})], "user")
+    assert contents(LocalVectorStore(str(tmp_path), DIM)) == {"a": {"text": "a"}, "c": {"text": "c"}}
+
+def test_handles_on_one_directory_see_each_others_writes(tmp_path):
+    # Stand-ins for the server and CLI_DB_Manager.py / backend.reembed running against the same path
+    server, cli = LocalVectorStore(str(tmp_path), DIM), LocalVectorStore(str(tmp_path), DIM)
+    expected = {}
+    for i in range(10):
+        writer = server if i % 2 else cli
+        writer.upsert([(f"id{i}", unit(i), {"i": i})], "user")
+        expected[f"id{i}"] = {"i": i}
+    cli.delete(["id3"], "user")
+    del expected["id3"]
+    server.upsert([("late", unit(3), {"i": "late"})], "user")  # Compacts from the server's view, must keep the CLI's changes
+    expected["late"] = {"i": "late"}
+    assert contents(server) == contents(cli) == expected
+    assert contents(LocalVectorStore(str(tmp_path), DIM)) == expected
+
+    cli.delete_namespace("user")
+    assert server.query(unit(0), 3, "user") == {"matches": []}
+    server.upsert([("new", unit(0), {})], "user")
+    assert contents(cli) == {"new": {}}